@@ -0,0 +1,219 @@
+#!/usr/bin/env python3
+"""Offline analysis of challenge event logs, per experimental condition.
+
+Reads the files written by --event-log (binary or JSON lines) from any number of
+containers into columnar NumPy arrays and compares the control and treatment
+conditions: how often participants chose the default ports over the
+user-defined ones, in which order, how many closed ports they tried, how long
+they took between commands and how many completed the challenge.
+
+Requires NumPy (not needed by the challenge itself).
+"""
+import argparse
+import json
+import os
+import sys
+
+import numpy as np
+
+import eventlog
+from main import DEFAULT_PORTS_POPULAR, DEFAULT_PORTS_UNPOPULAR, USER_DEFINED
+
+
+# Columnar layout of eventlog.RECORD
+EVENT_DTYPE = np.dtype([
+    ("ts", "<f8"), ("session", "<u8"), ("event", "u1"), ("condition", "u1"),
+    ("port", "<u2"), ("result", "u1"), ("fragment", "i1"),
+])
+assert EVENT_DTYPE.itemsize == eventlog.RECORD.size
+
+CONDITIONS = {0: "control", 1: "treatment"}
+JSONL_CHUNK = 65536
+
+
+def find_logs(paths):
+    """Expand files and directories into event log files"""
+    extensions = tuple(eventlog.FORMATS.values())
+    for path in paths:
+        if os.path.isdir(path):
+            for root, _, files in os.walk(path):
+                for name in sorted(files):
+                    if name.startswith("events-") and name.endswith(extensions):
+                        yield os.path.join(root, name)
+        else:
+            yield path
+
+def load_file(path):
+    """Load one log file as a structured array (memory-mapped for binary logs)"""
+    if path.endswith(eventlog.FORMATS["binary"]):
+        with open(path, "rb") as f:
+            if f.read(len(eventlog.MAGIC)) != eventlog.MAGIC:
+                raise ValueError(f"{path} is not a binary event log")
+            size = os.fstat(f.fileno()).st_size
+        # A record cut short by a crash is ignored
+        count = (size - len(eventlog.MAGIC)) // EVENT_DTYPE.itemsize
+        if not count:
+            return np.empty(0, dtype=EVENT_DTYPE)
+        return np.memmap(path, dtype=EVENT_DTYPE, mode="r", offset=len(eventlog.MAGIC), shape=(count,))
+
+    # JSON lines are converted in chunks so only one chunk of tuples exists at a time
+    chunks = []
+    records = []
+    for record in eventlog.read_events(path):
+        records.append(record)
+        if len(records) == JSONL_CHUNK:
+            chunks.append(np.array(records, dtype=EVENT_DTYPE))
+            records = []
+    if records or not chunks:
+        chunks.append(np.array(records, dtype=EVENT_DTYPE))
+    return np.concatenate(chunks)
+
+def load_events(paths):
+    """Load every log under paths into one array sorted by session, then time.
+
+    The sort is an argsort of the session column. The other columns are then
+    handled one at a time: concatenated across files and taken in sorted order
+    straight into the output, so only one column is held twice at any moment."""
+    arrays = [load_file(path) for path in find_logs(paths)]
+    events = np.empty(sum(len(array) for array in arrays), dtype=EVENT_DTYPE)
+    if not len(events):
+        return events
+    # A session is written by a single process, in time order, and files are read in
+    # rotation order, so a stable sort by session keeps each session chronological
+    order = np.argsort(np.concatenate([array["session"] for array in arrays]), kind="stable")
+    for name in EVENT_DTYPE.names:
+        np.take(np.concatenate([array[name] for array in arrays]), order, out=events[name])
+    return events
+
+def rate(numerator, denominator):
+    return float(numerator) / denominator if denominator else None
+
+def summarize_delays(delays):
+    if not len(delays):
+        return {"count": 0}
+    p50, p90 = np.percentile(delays, [50, 90])
+    return {"count": int(len(delays)), "mean_s": float(delays.mean()), "p50_s": float(p50), "p90_s": float(p90)}
+
+def analyze(events):
+    """Per-condition statistics from a session-sorted event array"""
+    # Events are sorted by session, so sessions are runs of equal ids
+    session = events["session"]
+    first = np.ones(len(events), dtype=bool)
+    first[1:] = session[1:] != session[:-1]
+    session_index = np.cumsum(first) - 1
+    n_sessions = int(first.sum())
+    # Condition of each session, from its first record
+    session_condition = events["condition"][first]
+
+    event = events["event"]
+    result = events["result"]
+    port = events["port"]
+    condition = events["condition"]
+
+    completed = np.zeros(n_sessions, dtype=bool)
+    completed[session_index[(event == eventlog.END) & (result == eventlog.COMPLETED)]] = True
+
+    # Successful connections, classified as the condition's default ports or user-defined
+    connected = (event == eventlog.CONNECT) & (result == eventlog.CONNECTED)
+    default_ports = np.where(condition == 1,
+                             np.isin(port, list(DEFAULT_PORTS_POPULAR)),
+                             np.isin(port, list(DEFAULT_PORTS_UNPOPULAR)))
+    user_ports = np.isin(port, list(USER_DEFINED))
+    default_choice = connected & default_ports
+    user_choice = connected & user_ports
+
+    closed_attempt = (event == eventlog.CONNECT) & (result == eventlog.CLOSED)
+    closed_per_session = np.bincount(session_index[closed_attempt], minlength=n_sessions)
+    default_per_session = np.bincount(session_index[default_choice], minlength=n_sessions)
+
+    # Time between consecutive commands of the same session (start and end are not commands)
+    is_command = (event != eventlog.START) & (event != eventlog.END)
+    command_ts = events["ts"][is_command]
+    command_session = session_index[is_command]
+    same_session = command_session[1:] == command_session[:-1]
+    delays = np.diff(command_ts)[same_session]
+    delay_condition = session_condition[command_session[1:][same_session]]
+
+    report = {}
+    for code, name in CONDITIONS.items():
+        in_condition = session_condition == code
+        sessions = int(in_condition.sum())
+        if not sessions:
+            continue
+        record_mask = condition == code
+        n_connected = int((connected & record_mask).sum())
+        n_default = int((default_choice & record_mask).sum())
+        n_user = int((user_choice & record_mask).sum())
+
+        # Choice order: share of default ports among the k-th port chosen
+        order = []
+        for k in range(1, 5):
+            kth = connected & record_mask & (events["fragment"] == k)
+            order.append(rate((kth & default_ports).sum(), kth.sum()))
+
+        chose_default = default_per_session[in_condition]
+        report[name] = {
+            "sessions": sessions,
+            "completion_rate": rate(completed[in_condition].sum(), sessions),
+            "connections": n_connected,
+            "default_choice_rate": rate(n_default, n_connected),
+            "user_defined_choice_rate": rate(n_user, n_connected),
+            "default_rate_by_choice_order": order,
+            "mean_default_ports_per_session": float(chose_default.mean()),
+            "default_ports_per_session_histogram": np.bincount(chose_default, minlength=5).tolist(),
+            "closed_port_attempts": int(closed_per_session[in_condition].sum()),
+            "sessions_with_closed_attempts": rate((closed_per_session[in_condition] > 0).sum(), sessions),
+            "time_between_commands": summarize_delays(delays[delay_condition == code]),
+        }
+    return report
+
+def format_rate(value):
+    return "n/a" if value is None else f"{value * 100:.1f}%"
+
+def print_report(report, total_events):
+    print(f"Events analyzed: {total_events}")
+    for name, stats in report.items():
+        delays = stats["time_between_commands"]
+        print(f"\n=== {name} ===")
+        print(f"Sessions: {stats['sessions']} (completed: {format_rate(stats['completion_rate'])})")
+        print(f"Connections: {stats['connections']} "
+              f"(default: {format_rate(stats['default_choice_rate'])}, "
+              f"user-defined: {format_rate(stats['user_defined_choice_rate'])})")
+        print("Default share by choice order: "
+              + ", ".join(f"#{k} {format_rate(value)}" for k, value in
+                          enumerate(stats["default_rate_by_choice_order"], 1)))
+        print(f"Default ports per session: mean {stats['mean_default_ports_per_session']:.2f}, "
+              f"histogram {stats['default_ports_per_session_histogram']}")
+        print(f"Closed port attempts: {stats['closed_port_attempts']} "
+              f"(sessions with any: {format_rate(stats['sessions_with_closed_attempts'])})")
+        if delays["count"]:
+            print(f"Time between commands: mean {delays['mean_s']:.2f}s, "
+                  f"p50 {delays['p50_s']:.2f}s, p90 {delays['p90_s']:.2f}s")
+
+def parse_arguments():
+    parser = argparse.ArgumentParser(description='Analyze port scanning challenge event logs')
+    parser.add_argument('paths', nargs='+',
+                        help='Event log files or directories (searched recursively)')
+    parser.add_argument('--json', metavar='FILE',
+                        help='Also write the report as JSON to FILE ("-" for stdout)')
+    return parser.parse_args()
+
+def main():
+    args = parse_arguments()
+    events = load_events(args.paths)
+    if not len(events):
+        print("No events found.", file=sys.stderr)
+        sys.exit(1)
+    report = analyze(events)
+    print_report(report, len(events))
+
+    if args.json:
+        output = json.dumps(report, indent=2)
+        if args.json == "-":
+            print(output)
+        else:
+            with open(args.json, "w") as f:
+                f.write(output)
+
+if __name__ == "__main__":
+    main()
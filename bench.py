@@ -0,0 +1,409 @@
+#!/usr/bin/env python3
+"""Benchmarks for the port scanning challenge server.
+
+startup: time from connect() to the first prompt.
+load:    N simulated players run scripted or randomized command sequences
+         against the server; reports time-to-prompt, per-command latency
+         percentiles, throughput, RSS per session and file descriptors.
+
+Every serving mode (socat, serve, prefork) is launched locally on loopback,
+and results can be written as JSON so regressions can be tracked.
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import re
+import shutil
+import socket
+import subprocess
+import sys
+import time
+
+
+MAIN = os.path.join(os.path.dirname(os.path.abspath(__file__)), "main.py")
+PROMPT = b"Enter command: "
+SCAN_LINE = re.compile(rb"(\d+)/tcp\s*\x1b\[0m open")
+COMMANDS = ("scan", "connect", "status", "help", "invalid")
+# Longest wait for players to reach the barrier before sampling whoever is live
+BARRIER_TIMEOUT = 30
+
+
+def server_command(mode, port, workers=8, extra_args=()):
+    """Build the command line that serves the challenge on port in the given mode"""
+    challenge_args = ["--treatment", *extra_args]
+    if mode == "socat":
+        exec_cmd = " ".join([sys.executable, MAIN, *challenge_args])
+        return ["socat", f"tcp-listen:{port},bind=127.0.0.1,reuseaddr,fork", f"EXEC:{exec_cmd}"]
+    if mode == "serve":
+        return [sys.executable, MAIN, "--serve", str(port), "--host", "127.0.0.1", *challenge_args]
+    if mode == "prefork":
+        return [sys.executable, MAIN, "--serve", str(port), "--host", "127.0.0.1",
+                "--prefork", str(workers), *challenge_args]
+    raise ValueError(f"Unknown server mode: {mode}")
+
+def start_server(mode, port, workers=8, extra_args=(), timeout=10.0):
+    """Launch a server in the given mode and wait until it accepts connections"""
+    if mode == "socat" and shutil.which("socat") is None:
+        raise RuntimeError("socat is not installed")
+    try:
+        with socket.create_connection(("127.0.0.1", port), timeout=0.2):
+            raise RuntimeError(f"port {port} is already in use")
+    except OSError:
+        pass
+    proc = subprocess.Popen(server_command(mode, port, workers, extra_args),
+                            stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline and proc.poll() is None:
+        try:
+            with socket.create_connection(("127.0.0.1", port), timeout=0.2):
+                return proc
+        except OSError:
+            time.sleep(0.05)
+    proc.kill()
+    raise RuntimeError(f"{mode} server did not start listening on port {port}")
+
+def stop_server(proc):
+    proc.terminate()
+    try:
+        proc.wait(timeout=5)
+    except subprocess.TimeoutExpired:
+        proc.kill()
+        proc.wait()
+
+def percentile(values, pct):
+    """Nearest-rank percentile of an unsorted list"""
+    if not values:
+        return None
+    ordered = sorted(values)
+    rank = max(0, min(len(ordered) - 1, int(round(pct / 100 * len(ordered) + 0.5)) - 1))
+    return ordered[rank]
+
+def summarize(values):
+    """Latency summary in milliseconds"""
+    if not values:
+        return {"count": 0}
+    return {
+        "count": len(values),
+        "min_ms": min(values) * 1000,
+        "p50_ms": percentile(values, 50) * 1000,
+        "p95_ms": percentile(values, 95) * 1000,
+        "p99_ms": percentile(values, 99) * 1000,
+        "max_ms": max(values) * 1000,
+    }
+
+async def time_to_prompt(host, port):
+    """Seconds from connect() until the first command prompt arrives"""
+    start = time.perf_counter()
+    reader, writer = await asyncio.open_connection(host, port)
+    try:
+        await reader.readuntil(PROMPT)
+        return time.perf_counter() - start
+    finally:
+        writer.close()
+
+async def measure_startup(host, port, connections, concurrency):
+    """Open connections (concurrency at a time) and collect their time-to-first-prompt"""
+    semaphore = asyncio.Semaphore(concurrency)
+    results = []
+    errors = 0
+
+    async def one():
+        nonlocal errors
+        async with semaphore:
+            try:
+                results.append(await time_to_prompt(host, port))
+            except (OSError, asyncio.IncompleteReadError):
+                errors += 1
+
+    await asyncio.gather(*[one() for _ in range(connections)])
+    return results, errors
+
+def run_startup(mode, port, connections, concurrency, workers):
+    proc = start_server(mode, port, workers)
+    try:
+        # Let a pre-forked pool finish warming up before measuring
+        time.sleep(0.5)
+        results, errors = asyncio.run(measure_startup("127.0.0.1", port, connections, concurrency))
+    finally:
+        stop_server(proc)
+    return {"mode": mode, "connections": connections, "concurrency": concurrency,
+            "errors": errors, "time_to_prompt": summarize(results)}
+
+def print_startup_report(report):
+    ttp = report["time_to_prompt"]
+    print(f"\n=== {report['mode']} ===")
+    print(f"Connections: {ttp['count']}/{report['connections']} (errors: {report['errors']})")
+    if ttp["count"]:
+        print(f"Time to first prompt: min {ttp['min_ms']:.1f} ms, p50 {ttp['p50_ms']:.1f} ms, "
+              f"p95 {ttp['p95_ms']:.1f} ms, p99 {ttp['p99_ms']:.1f} ms, max {ttp['max_ms']:.1f} ms")
+
+def process_tree(root):
+    """pids of root and all of its descendants"""
+    children = {}
+    for entry in os.listdir("/proc"):
+        if not entry.isdigit():
+            continue
+        try:
+            with open(f"/proc/{entry}/stat") as f:
+                # The command name may contain spaces; the ppid follows its closing paren
+                ppid = int(f.read().rsplit(")", 1)[1].split()[1])
+        except (OSError, IndexError, ValueError):
+            continue
+        children.setdefault(ppid, []).append(int(entry))
+    pids = [root]
+    for pid in pids:
+        pids.extend(children.get(pid, ()))
+    return pids
+
+def process_memory(pid):
+    """Proportional set size of a process, so pages shared by forked workers count once
+    across the tree; falls back to RSS where smaps_rollup is unavailable"""
+    try:
+        with open(f"/proc/{pid}/smaps_rollup") as f:
+            for line in f:
+                if line.startswith("Pss:"):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        pass
+    with open(f"/proc/{pid}/status") as f:
+        for line in f:
+            if line.startswith("VmRSS:"):
+                return int(line.split()[1]) * 1024
+    return 0
+
+def resource_usage(root):
+    """Total memory (bytes) and open file descriptors of a process tree"""
+    pids = process_tree(root)
+    memory = 0
+    fds = 0
+    for pid in pids:
+        try:
+            memory += process_memory(pid)
+            fds += len(os.listdir(f"/proc/{pid}/fd"))
+        except OSError:
+            continue
+    return {"processes": len(pids), "rss_bytes": memory, "fds": fds}
+
+def player_script(kind, rng, length):
+    """Command kinds a player sends before connecting to four open ports"""
+    if kind == "scripted":
+        return ["scan", "status", "invalid", "connect_closed", "connect_invalid", "help", "status"][:max(length, 1)]
+    script = ["scan"]
+    script += rng.choices(["scan", "status", "help", "invalid", "connect_closed", "connect_invalid"],
+                          k=max(length - 1, 0))
+    return script
+
+class Barrier:
+    """Holds players at their first prompt until parties of them are live (asyncio.Barrier needs 3.11)"""
+
+    def __init__(self, parties):
+        self.parties = parties
+        self.arrived = 0
+        self.full = asyncio.Event()
+        self.released = asyncio.Event()
+        self.check()
+
+    def check(self):
+        if self.arrived >= self.parties:
+            self.full.set()
+
+    async def wait(self):
+        self.arrived += 1
+        self.check()
+        await self.released.wait()
+
+    def leave(self):
+        """A player that failed before reaching the barrier"""
+        self.parties -= 1
+        self.check()
+
+class Player:
+    """One simulated participant driving a session over TCP"""
+
+    def __init__(self, host, port, script, rng, timings):
+        self.host = host
+        self.port = port
+        self.script = script
+        self.rng = rng
+        self.timings = timings
+        self.open_ports = []
+
+    async def command(self, kind, line, final=False):
+        """Send one command and time it until the next prompt (or EOF after the last one)"""
+        start = time.perf_counter()
+        self.writer.write(line.encode() + b"\n")
+        if final:
+            output = await self.reader.read()
+        else:
+            output = await self.reader.readuntil(PROMPT)
+        self.timings[kind].append(time.perf_counter() - start)
+        return output
+
+    async def connect(self):
+        start = time.perf_counter()
+        self.reader, self.writer = await asyncio.open_connection(self.host, self.port, limit=1 << 20)
+        await self.reader.readuntil(PROMPT)
+        self.timings["time_to_prompt"].append(time.perf_counter() - start)
+
+    async def play(self, barrier):
+        try:
+            await self.connect()
+        except BaseException:
+            barrier.leave()
+            raise
+        await barrier.wait()
+        try:
+            for kind in self.script:
+                if kind == "scan":
+                    output = await self.command("scan", "scan")
+                    self.open_ports = [int(port) for port in SCAN_LINE.findall(output)]
+                elif kind == "connect_closed":
+                    await self.command("connect", f"connect {self.rng.choice([1, 7, 443, 8080, 31337])}")
+                elif kind == "connect_invalid":
+                    await self.command("connect", "connect 70000")
+                elif kind == "invalid":
+                    await self.command("invalid", "hack")
+                else:
+                    await self.command(kind, kind)
+            chosen = self.rng.sample(self.open_ports, 4)
+            for n, port in enumerate(chosen, 1):
+                await self.command("connect", f"connect {port}", final=n == 4)
+        finally:
+            self.writer.close()
+
+async def run_players(host, port, players, kind, length, seed, server_pid, capacity):
+    """Start every player at once and wait until all have finished.
+
+    Players wait at their first prompt until capacity sessions are live (or
+    BARRIER_TIMEOUT passes); the server's process tree is sampled then, with
+    every held session open, before they are released to run their scripts."""
+    rng = random.Random(seed)
+    timings = {name: [] for name in ("time_to_prompt",) + COMMANDS}
+    crowd = [Player(host, port, player_script(kind, rng, length), random.Random(rng.random()), timings)
+             for _ in range(players)]
+    barrier = Barrier(min(players, capacity))
+    games = asyncio.gather(*[player.play(barrier) for player in crowd], return_exceptions=True)
+    try:
+        await asyncio.wait_for(barrier.full.wait(), BARRIER_TIMEOUT)
+    except asyncio.TimeoutError:
+        pass
+    peak = dict(resource_usage(server_pid), sessions=barrier.arrived)
+    start = time.perf_counter()
+    barrier.released.set()
+    results = await games
+    duration = time.perf_counter() - start
+    errors = sum(1 for result in results if isinstance(result, BaseException))
+    return timings, duration, errors, peak
+
+def run_load(mode, port, players, kind, length, seed, workers, paced):
+    extra_args = () if paced else ("--instant",)
+    proc = start_server(mode, port, workers, extra_args)
+    # A pre-forked pool runs one session per worker; the other players wait for a free worker
+    capacity = workers if mode == "prefork" else players
+    try:
+        time.sleep(0.5)
+        idle = resource_usage(proc.pid)
+        timings, duration, errors, peak = asyncio.run(
+            run_players("127.0.0.1", port, players, kind, length, seed, proc.pid, capacity))
+    finally:
+        stop_server(proc)
+
+    commands = sum(len(timings[name]) for name in COMMANDS)
+    sessions = max(peak["sessions"], 1)
+    return {
+        "mode": mode,
+        "players": players,
+        "script": kind,
+        "paced": paced,
+        "errors": errors,
+        "duration_s": duration,
+        "commands": commands,
+        "throughput_cmds_per_s": commands / duration if duration else None,
+        "time_to_prompt": summarize(timings["time_to_prompt"]),
+        "latency": {name: summarize(timings[name]) for name in COMMANDS},
+        "resources": {
+            "idle": idle,
+            "peak": peak,
+            "rss_per_session_bytes": (peak["rss_bytes"] - idle["rss_bytes"]) / sessions,
+            "fds_per_session": (peak["fds"] - idle["fds"]) / sessions,
+        },
+    }
+
+def print_load_report(report):
+    resources = report["resources"]
+    print(f"\n=== {report['mode']} ({report['players']} players, {report['script']}) ===")
+    print(f"Errors: {report['errors']}")
+    print(f"Commands: {report['commands']} in {report['duration_s']:.2f}s "
+          f"({report['throughput_cmds_per_s']:.0f} commands/s)")
+    for name in ("time_to_prompt",) + COMMANDS:
+        stats = report["time_to_prompt"] if name == "time_to_prompt" else report["latency"][name]
+        if stats["count"]:
+            print(f"  {name:<15} n={stats['count']:<6} p50 {stats['p50_ms']:8.1f} ms  "
+                  f"p95 {stats['p95_ms']:8.1f} ms  p99 {stats['p99_ms']:8.1f} ms")
+    print(f"Peak: {resources['peak']['sessions']} sessions, {resources['peak']['processes']} processes, "
+          f"{resources['peak']['rss_bytes'] / 1024 / 1024:.1f} MB RSS, {resources['peak']['fds']} fds")
+    print(f"Per session: {resources['rss_per_session_bytes'] / 1024:.1f} KB RSS, "
+          f"{resources['fds_per_session']:.2f} fds")
+
+def write_json(reports, destination):
+    output = json.dumps(reports, indent=2)
+    if destination == "-":
+        print(output)
+    else:
+        with open(destination, "w") as f:
+            f.write(output)
+
+def parse_arguments():
+    parser = argparse.ArgumentParser(description='Port scanning challenge benchmarks')
+    subparsers = parser.add_subparsers(dest='benchmark', required=True)
+    startup = subparsers.add_parser('startup', help='Time from connect() to the first prompt')
+    load = subparsers.add_parser('load', help='Simulated players running command sequences')
+    for sub in (startup, load):
+        sub.add_argument('--mode', action='append', choices=['socat', 'serve', 'prefork'],
+                         help='Serving mode to benchmark (repeatable, default: serve and prefork)')
+        sub.add_argument('--port', type=int, default=5599,
+                         help='Loopback port for the benchmarked server')
+        sub.add_argument('--workers', type=int, default=8,
+                         help='Worker pool size for prefork mode')
+        sub.add_argument('--json', metavar='FILE',
+                         help='Also write machine-readable results to FILE ("-" for stdout)')
+    startup.add_argument('--connections', type=int, default=100,
+                         help='Number of connections to open')
+    startup.add_argument('--concurrency', type=int, default=1,
+                         help='Connections opened at the same time')
+    load.add_argument('--players', type=int, default=100,
+                      help='Number of concurrent simulated players')
+    load.add_argument('--script', choices=['scripted', 'random'], default='scripted',
+                      help='Fixed command sequence, or a seeded random mix including wrong ports')
+    load.add_argument('--length', type=int, default=7,
+                      help='Commands each player sends before collecting the four fragments')
+    load.add_argument('--seed', type=int, default=0,
+                      help='Seed for randomized players and port choices')
+    load.add_argument('--paced', action='store_true',
+                      help='Keep the real scan/connect delays instead of running the server with --instant')
+    return parser.parse_args()
+
+def main():
+    args = parse_arguments()
+    reports = []
+    for mode in args.mode or ["serve", "prefork"]:
+        try:
+            if args.benchmark == "startup":
+                report = run_startup(mode, args.port, args.connections, args.concurrency, args.workers)
+                print_startup_report(report)
+            else:
+                report = run_load(mode, args.port, args.players, args.script, args.length, args.seed,
+                                  args.workers, args.paced)
+                print_load_report(report)
+        except RuntimeError as e:
+            print(f"Skipping {mode}: {e}", file=sys.stderr)
+            continue
+        reports.append(report)
+
+    if args.json:
+        write_json(reports, args.json)
+
+if __name__ == "__main__":
+    main()
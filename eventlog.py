@@ -0,0 +1,266 @@
+#!/usr/bin/env python3
+"""Append-only structured event log for challenge sessions.
+
+Every session command becomes one record. Records are queued in memory by the
+session and written by a background thread in batches, so logging never blocks
+the command loop. Two on-disk formats are supported:
+
+- jsonl: one JSON object per line
+- binary: an 8-byte magic header followed by fixed-size little-endian records
+  (RECORD), which can be memory-mapped straight into a NumPy structured array
+
+Files are named events-<host>-<pid>-<start time>-<seq>.<ext> and rotate once
+they pass rotate_bytes, so many processes and containers can share a directory.
+With retain_bytes set, a log deletes its own oldest files on rotation once they
+pass retain_bytes together; files written by other processes are never touched.
+
+Logging is best effort: when the disk is full or the writer falls behind,
+records are dropped and counted (dropped, write_errors) instead of piling up
+in memory.
+"""
+import collections
+import json
+import os
+import socket
+import struct
+import sys
+import threading
+import time
+
+
+MAGIC = b"PSCEVT1\n"
+# timestamp, session id, event, condition (1 = treatment), port, result, fragment
+# (the part number for CONNECT, the number of fragments collected for END)
+RECORD = struct.Struct("<dQBBHBb")
+
+# Event types
+START = 1
+SCAN = 2
+CONNECT = 3
+STATUS = 4
+HELP = 5
+INVALID = 6
+EXIT = 7
+END = 8
+EVENT_NAMES = ("", "start", "scan", "connect", "status", "help", "invalid", "exit", "end")
+
+# Results of a CONNECT event
+CONNECTED = 1
+ALREADY_CONNECTED = 2
+CLOSED = 3
+NOT_SCANNED = 4
+INVALID_PORT = 5
+# Results of an END event
+COMPLETED = 1
+EXITED = 2
+DISCONNECTED = 3
+REAPED = 4
+CONNECT_RESULTS = ("", "connected", "already_connected", "closed", "not_scanned", "invalid_port")
+END_RESULTS = ("", "completed", "exited", "disconnected", "reaped")
+
+FORMATS = {"jsonl": ".jsonl", "binary": ".bin"}
+FSYNC_POLICIES = ("none", "rotate", "batch")
+
+ROTATE_BYTES = 4 * 1024 * 1024
+# Bytes of its own files a log keeps; None keeps everything
+RETAIN_BYTES = None
+# Records held in memory while the writer is behind (roughly 200 bytes each)
+MAX_QUEUED = 50000
+
+
+def result_name(event, result):
+    if event == CONNECT:
+        return CONNECT_RESULTS[result]
+    if event == END:
+        return END_RESULTS[result]
+    return None
+
+def encode_jsonl(record):
+    timestamp, session_id, event, condition, port, result, fragment = record
+    return (json.dumps({
+        "ts": timestamp,
+        "session": f"{session_id:016x}",
+        "event": EVENT_NAMES[event],
+        "condition": condition,
+        "port": port or None,
+        "result": result_name(event, result),
+        "fragment": fragment or None,
+    }, separators=(",", ":")) + "\n").encode()
+
+def decode_jsonl(line):
+    entry = json.loads(line)
+    event = EVENT_NAMES.index(entry["event"])
+    result = entry["result"]
+    if result is not None:
+        result = (CONNECT_RESULTS if event == CONNECT else END_RESULTS).index(result)
+    return (entry["ts"], int(entry["session"], 16), event, entry["condition"],
+            entry["port"] or 0, result or 0, entry["fragment"] or 0)
+
+def read_events(path):
+    """Yield the records of one log file as tuples in RECORD field order"""
+    with open(path, "rb") as f:
+        if path.endswith(FORMATS["binary"]):
+            if f.read(len(MAGIC)) != MAGIC:
+                raise ValueError(f"{path} is not a binary event log")
+            while True:
+                data = f.read(RECORD.size * 1024)
+                if not data:
+                    break
+                # A record cut short by a crash is ignored
+                usable = len(data) - len(data) % RECORD.size
+                yield from RECORD.iter_unpack(data[:usable])
+        else:
+            for line in f:
+                # A line cut short by a crash or a full disk is ignored
+                if line.strip() and line.endswith(b"\n"):
+                    yield decode_jsonl(line)
+
+
+class EventLog:
+    """Batched background writer for session events"""
+
+    def __init__(self, directory, fmt="jsonl", rotate_bytes=ROTATE_BYTES, fsync="rotate",
+                 flush_interval=0.5, batch_size=4096, retain_bytes=RETAIN_BYTES, max_queued=MAX_QUEUED):
+        if fmt not in FORMATS:
+            raise ValueError(f"Unknown event log format: {fmt}")
+        if fsync not in FSYNC_POLICIES:
+            raise ValueError(f"Unknown fsync policy: {fsync}")
+        os.makedirs(directory, exist_ok=True)
+        self.directory = directory
+        self.fmt = fmt
+        self.rotate_bytes = rotate_bytes
+        self.fsync = fsync
+        self.flush_interval = flush_interval
+        self.batch_size = batch_size
+        self.retain_bytes = retain_bytes
+        self.max_queued = max_queued
+        # Records discarded because the queue was full or their write failed
+        self.dropped = 0
+        self.write_errors = 0
+        self.prefix = f"events-{socket.gethostname()}-{os.getpid()}-{time.strftime('%Y%m%dT%H%M%S')}"
+        self.sequence = 0
+        self.file = None
+        self.file_bytes = 0
+        # deque.append/popleft are atomic, so producers never take a lock
+        self.queue = collections.deque()
+        self.wakeup = threading.Event()
+        self.closed = False
+        self.thread = threading.Thread(target=self.writer_loop, name="event-log", daemon=True)
+        self.thread.start()
+
+    def emit(self, session_id, event, condition, port=0, result=0, fragment=0, timestamp=None):
+        """Queue one event; called from the command loop and never blocks on I/O.
+
+        timestamp defaults to the current wall time; sessions pass their clock's time
+        so --instant and --script replays record virtual time."""
+        if timestamp is None:
+            timestamp = time.time()
+        queued = len(self.queue)
+        if queued >= self.max_queued:
+            self.dropped += 1
+            return
+        self.queue.append((timestamp, session_id, event, condition, port, result, fragment))
+        if queued + 1 >= self.batch_size:
+            self.wakeup.set()
+
+    def close(self):
+        """Flush everything queued so far and stop the writer thread"""
+        self.closed = True
+        self.wakeup.set()
+        self.thread.join()
+        if self.dropped:
+            print(f"event log: {self.dropped} records dropped ({self.write_errors} write errors)",
+                  file=sys.stderr)
+
+    def writer_loop(self):
+        while True:
+            self.wakeup.wait(self.flush_interval)
+            self.wakeup.clear()
+            closing = self.closed
+            self.write_batch()
+            if closing:
+                break
+        if self.file is not None:
+            self.close_file()
+
+    def write_batch(self):
+        """Write everything queued; on an I/O error the batch is dropped and counted"""
+        queue = self.queue
+        encode = RECORD.pack if self.fmt == "binary" else None
+        chunks = []
+        while queue:
+            record = queue.popleft()
+            chunks.append(encode(*record) if encode else encode_jsonl(record))
+        if not chunks:
+            return
+        try:
+            if self.file is None or self.file_bytes >= self.rotate_bytes:
+                self.open_next_file()
+            data = b"".join(chunks)
+            self.file.write(data)
+            self.file.flush()
+            self.file_bytes += len(data)
+            if self.fsync == "batch":
+                os.fsync(self.file.fileno())
+        except OSError as error:
+            if not self.write_errors:
+                print(f"event log: write failed, dropping records: {error}", file=sys.stderr)
+            self.write_errors += 1
+            self.dropped += len(chunks)
+            # Start a fresh file with the next batch, after making room if possible
+            self.abandon_file()
+
+    def open_next_file(self):
+        if self.file is not None:
+            self.close_file()
+        self.enforce_retention()
+        self.sequence += 1
+        path = os.path.join(self.directory, f"{self.prefix}-{self.sequence:04d}{FORMATS[self.fmt]}")
+        self.file = open(path, "ab")
+        self.file_bytes = 0
+        if self.fmt == "binary":
+            self.file.write(MAGIC)
+            self.file_bytes = len(MAGIC)
+
+    def close_file(self):
+        try:
+            self.file.flush()
+            if self.fsync != "none":
+                os.fsync(self.file.fileno())
+        finally:
+            self.file.close()
+            self.file = None
+
+    def abandon_file(self):
+        if self.file is not None:
+            try:
+                self.close_file()
+            except OSError:
+                self.file = None
+
+    def enforce_retention(self):
+        """Delete this log's oldest files until they fit in retain_bytes.
+
+        Only files named with this log's prefix count: other workers and containers
+        sharing the directory keep their files, whatever their age."""
+        if self.retain_bytes is None:
+            return
+        files = []
+        for entry in os.scandir(self.directory):
+            if entry.name.startswith(f"{self.prefix}-") and entry.name.endswith(tuple(FORMATS.values())):
+                try:
+                    stat = entry.stat()
+                except FileNotFoundError:
+                    continue
+                files.append((stat.st_mtime, entry.name, stat.st_size))
+        total = sum(size for _, _, size in files)
+        # Leave room for the file about to be opened
+        budget = self.retain_bytes - self.rotate_bytes
+        for _, name, size in sorted(files):
+            if total <= budget:
+                break
+            try:
+                os.remove(os.path.join(self.directory, name))
+            except FileNotFoundError:
+                pass
+            total -= size
@@ -0,0 +1,158 @@
+#!/usr/bin/env python3
+"""Render a flag as a PNG image without third-party dependencies.
+
+Used for templated (per-instance or per-session) flags: the text is drawn with
+a built-in 5x7 bitmap font into a 1-bit grayscale PNG, which is then base64
+encoded and split into the four fragments exactly like the static payload.
+"""
+import base64
+import struct
+import zlib
+
+
+# 5x7 glyphs for printable ASCII; each row is 5 bits, most significant bit on the left
+FONT = {
+    " ": (0x00, 0x00, 0x00, 0x00, 0x00, 0x00, 0x00),
+    "!": (0x04, 0x04, 0x04, 0x04, 0x00, 0x00, 0x04),
+    '"': (0x0A, 0x0A, 0x0A, 0x00, 0x00, 0x00, 0x00),
+    "#": (0x0A, 0x0A, 0x1F, 0x0A, 0x1F, 0x0A, 0x0A),
+    "$": (0x04, 0x0F, 0x14, 0x0E, 0x05, 0x1E, 0x04),
+    "%": (0x18, 0x19, 0x02, 0x04, 0x08, 0x13, 0x03),
+    "&": (0x0C, 0x12, 0x14, 0x08, 0x15, 0x12, 0x0D),
+    "'": (0x0C, 0x04, 0x08, 0x00, 0x00, 0x00, 0x00),
+    "(": (0x02, 0x04, 0x08, 0x08, 0x08, 0x04, 0x02),
+    ")": (0x08, 0x04, 0x02, 0x02, 0x02, 0x04, 0x08),
+    "*": (0x00, 0x04, 0x15, 0x0E, 0x15, 0x04, 0x00),
+    "+": (0x00, 0x04, 0x04, 0x1F, 0x04, 0x04, 0x00),
+    ",": (0x00, 0x00, 0x00, 0x00, 0x0C, 0x04, 0x08),
+    "-": (0x00, 0x00, 0x00, 0x1F, 0x00, 0x00, 0x00),
+    ".": (0x00, 0x00, 0x00, 0x00, 0x00, 0x0C, 0x0C),
+    "/": (0x00, 0x01, 0x02, 0x04, 0x08, 0x10, 0x00),
+    "0": (0x0E, 0x11, 0x13, 0x15, 0x19, 0x11, 0x0E),
+    "1": (0x04, 0x0C, 0x04, 0x04, 0x04, 0x04, 0x0E),
+    "2": (0x0E, 0x11, 0x01, 0x02, 0x04, 0x08, 0x1F),
+    "3": (0x1F, 0x02, 0x04, 0x02, 0x01, 0x11, 0x0E),
+    "4": (0x02, 0x06, 0x0A, 0x12, 0x1F, 0x02, 0x02),
+    "5": (0x1F, 0x10, 0x1E, 0x01, 0x01, 0x11, 0x0E),
+    "6": (0x06, 0x08, 0x10, 0x1E, 0x11, 0x11, 0x0E),
+    "7": (0x1F, 0x01, 0x02, 0x04, 0x08, 0x08, 0x08),
+    "8": (0x0E, 0x11, 0x11, 0x0E, 0x11, 0x11, 0x0E),
+    "9": (0x0E, 0x11, 0x11, 0x0F, 0x01, 0x02, 0x0C),
+    ":": (0x00, 0x0C, 0x0C, 0x00, 0x0C, 0x0C, 0x00),
+    ";": (0x00, 0x0C, 0x0C, 0x00, 0x0C, 0x04, 0x08),
+    "<": (0x02, 0x04, 0x08, 0x10, 0x08, 0x04, 0x02),
+    "=": (0x00, 0x00, 0x1F, 0x00, 0x1F, 0x00, 0x00),
+    ">": (0x08, 0x04, 0x02, 0x01, 0x02, 0x04, 0x08),
+    "?": (0x0E, 0x11, 0x01, 0x02, 0x04, 0x00, 0x04),
+    "@": (0x0E, 0x11, 0x01, 0x0D, 0x15, 0x15, 0x0E),
+    "A": (0x0E, 0x11, 0x11, 0x11, 0x1F, 0x11, 0x11),
+    "B": (0x1E, 0x11, 0x11, 0x1E, 0x11, 0x11, 0x1E),
+    "C": (0x0E, 0x11, 0x10, 0x10, 0x10, 0x11, 0x0E),
+    "D": (0x1C, 0x12, 0x11, 0x11, 0x11, 0x12, 0x1C),
+    "E": (0x1F, 0x10, 0x10, 0x1E, 0x10, 0x10, 0x1F),
+    "F": (0x1F, 0x10, 0x10, 0x1E, 0x10, 0x10, 0x10),
+    "G": (0x0E, 0x11, 0x10, 0x17, 0x11, 0x11, 0x0F),
+    "H": (0x11, 0x11, 0x11, 0x1F, 0x11, 0x11, 0x11),
+    "I": (0x0E, 0x04, 0x04, 0x04, 0x04, 0x04, 0x0E),
+    "J": (0x07, 0x02, 0x02, 0x02, 0x02, 0x12, 0x0C),
+    "K": (0x11, 0x12, 0x14, 0x18, 0x14, 0x12, 0x11),
+    "L": (0x10, 0x10, 0x10, 0x10, 0x10, 0x10, 0x1F),
+    "M": (0x11, 0x1B, 0x15, 0x15, 0x11, 0x11, 0x11),
+    "N": (0x11, 0x11, 0x19, 0x15, 0x13, 0x11, 0x11),
+    "O": (0x0E, 0x11, 0x11, 0x11, 0x11, 0x11, 0x0E),
+    "P": (0x1E, 0x11, 0x11, 0x1E, 0x10, 0x10, 0x10),
+    "Q": (0x0E, 0x11, 0x11, 0x11, 0x15, 0x12, 0x0D),
+    "R": (0x1E, 0x11, 0x11, 0x1E, 0x14, 0x12, 0x11),
+    "S": (0x0F, 0x10, 0x10, 0x0E, 0x01, 0x01, 0x1E),
+    "T": (0x1F, 0x04, 0x04, 0x04, 0x04, 0x04, 0x04),
+    "U": (0x11, 0x11, 0x11, 0x11, 0x11, 0x11, 0x0E),
+    "V": (0x11, 0x11, 0x11, 0x11, 0x11, 0x0A, 0x04),
+    "W": (0x11, 0x11, 0x11, 0x15, 0x15, 0x15, 0x0A),
+    "X": (0x11, 0x11, 0x0A, 0x04, 0x0A, 0x11, 0x11),
+    "Y": (0x11, 0x11, 0x11, 0x0A, 0x04, 0x04, 0x04),
+    "Z": (0x1F, 0x01, 0x02, 0x04, 0x08, 0x10, 0x1F),
+    "[": (0x0E, 0x08, 0x08, 0x08, 0x08, 0x08, 0x0E),
+    "\\": (0x00, 0x10, 0x08, 0x04, 0x02, 0x01, 0x00),
+    "]": (0x0E, 0x02, 0x02, 0x02, 0x02, 0x02, 0x0E),
+    "^": (0x04, 0x0A, 0x11, 0x00, 0x00, 0x00, 0x00),
+    "_": (0x00, 0x00, 0x00, 0x00, 0x00, 0x00, 0x1F),
+    "`": (0x08, 0x04, 0x02, 0x00, 0x00, 0x00, 0x00),
+    "a": (0x00, 0x00, 0x0E, 0x01, 0x0F, 0x11, 0x0F),
+    "b": (0x10, 0x10, 0x16, 0x19, 0x11, 0x11, 0x1E),
+    "c": (0x00, 0x00, 0x0E, 0x10, 0x10, 0x11, 0x0E),
+    "d": (0x01, 0x01, 0x0D, 0x13, 0x11, 0x11, 0x0F),
+    "e": (0x00, 0x00, 0x0E, 0x11, 0x1F, 0x10, 0x0E),
+    "f": (0x06, 0x09, 0x08, 0x1C, 0x08, 0x08, 0x08),
+    "g": (0x00, 0x0F, 0x11, 0x11, 0x0F, 0x01, 0x0E),
+    "h": (0x10, 0x10, 0x16, 0x19, 0x11, 0x11, 0x11),
+    "i": (0x04, 0x00, 0x0C, 0x04, 0x04, 0x04, 0x0E),
+    "j": (0x02, 0x00, 0x06, 0x02, 0x02, 0x12, 0x0C),
+    "k": (0x10, 0x10, 0x12, 0x14, 0x18, 0x14, 0x12),
+    "l": (0x0C, 0x04, 0x04, 0x04, 0x04, 0x04, 0x0E),
+    "m": (0x00, 0x00, 0x1A, 0x15, 0x15, 0x11, 0x11),
+    "n": (0x00, 0x00, 0x16, 0x19, 0x11, 0x11, 0x11),
+    "o": (0x00, 0x00, 0x0E, 0x11, 0x11, 0x11, 0x0E),
+    "p": (0x00, 0x00, 0x1E, 0x11, 0x1E, 0x10, 0x10),
+    "q": (0x00, 0x00, 0x0D, 0x13, 0x0F, 0x01, 0x01),
+    "r": (0x00, 0x00, 0x16, 0x19, 0x10, 0x10, 0x10),
+    "s": (0x00, 0x00, 0x0E, 0x10, 0x0E, 0x01, 0x1E),
+    "t": (0x08, 0x08, 0x1C, 0x08, 0x08, 0x09, 0x06),
+    "u": (0x00, 0x00, 0x11, 0x11, 0x11, 0x13, 0x0D),
+    "v": (0x00, 0x00, 0x11, 0x11, 0x11, 0x0A, 0x04),
+    "w": (0x00, 0x00, 0x11, 0x11, 0x15, 0x15, 0x0A),
+    "x": (0x00, 0x00, 0x11, 0x0A, 0x04, 0x0A, 0x11),
+    "y": (0x00, 0x00, 0x11, 0x11, 0x0F, 0x01, 0x0E),
+    "z": (0x00, 0x00, 0x1F, 0x02, 0x04, 0x08, 0x1F),
+    "{": (0x02, 0x04, 0x04, 0x08, 0x04, 0x04, 0x02),
+    "|": (0x04, 0x04, 0x04, 0x04, 0x04, 0x04, 0x04),
+    "}": (0x08, 0x04, 0x04, 0x02, 0x04, 0x04, 0x08),
+    "~": (0x00, 0x00, 0x08, 0x15, 0x02, 0x00, 0x00),
+}
+GLYPH_WIDTH = 5
+GLYPH_HEIGHT = 7
+
+
+def png_chunk(kind, data):
+    return struct.pack(">I", len(data)) + kind + data + struct.pack(">I", zlib.crc32(kind + data))
+
+def render_png(text, scale=4, margin=2, line_length=40):
+    """Draw text (wrapped every line_length characters) as black-on-white 1-bit PNG bytes"""
+    lines = [text[i:i + line_length] for i in range(0, len(text), line_length)] or [""]
+    columns = max(len(line) for line in lines)
+    # One blank pixel column between glyphs and one blank row between lines, in font units
+    width = (margin * 2 + columns * (GLYPH_WIDTH + 1) - 1) * scale
+    height = (margin * 2 + len(lines) * (GLYPH_HEIGHT + 1) - 1) * scale
+    row_bytes = (width + 7) // 8
+    blank = bytes([0xFF]) * row_bytes
+
+    rows = [blank] * (margin * scale)
+    for line_number, line in enumerate(lines):
+        if line_number:
+            rows += [blank] * scale
+        glyphs = [FONT.get(char, FONT["?"]) for char in line]
+        for glyph_row in range(GLYPH_HEIGHT):
+            # Bits set here are ink; they are inverted below since 0 is black in grayscale
+            ink = 0
+            for glyph in glyphs:
+                ink = (ink << (GLYPH_WIDTH + 1)) | (glyph[glyph_row] << 1)
+            ink >>= 1
+            ink_width = len(glyphs) * (GLYPH_WIDTH + 1) - 1 if glyphs else 0
+            pixels = 0
+            for bit in range(ink_width - 1, -1, -1):
+                pixels = (pixels << scale) | (((1 << scale) - 1) if ink >> bit & 1 else 0)
+            # Place the scaled ink after the left margin, then pad to whole bytes
+            total_bits = row_bytes * 8
+            pixels <<= total_bits - margin * scale - ink_width * scale
+            row = (~pixels & ((1 << total_bits) - 1)).to_bytes(row_bytes, "big")
+            rows += [row] * scale
+    rows += [blank] * (height - len(rows))
+
+    raw = b"".join(b"\x00" + row for row in rows)
+    return (b"\x89PNG\r\n\x1a\n"
+            + png_chunk(b"IHDR", struct.pack(">IIBBBBB", width, height, 1, 0, 0, 0, 0))
+            + png_chunk(b"IDAT", zlib.compress(raw, 9))
+            + png_chunk(b"IEND", b""))
+
+def encode_flag(flag):
+    """The base64 text of the flag image, ready to split into fragments"""
+    return base64.b64encode(render_png(flag))
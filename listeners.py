@@ -0,0 +1,242 @@
+#!/usr/bin/env python3
+"""Real TCP listeners for the simulated open ports (--listeners).
+
+Each session's open ports are bound on host ports taken from a shared range and
+answered by small protocol stubs (HTTP, FTP, SSH or a generic line service), so
+participants can use real tools such as nmap and nc. Every listener and stub
+connection of every session runs on the server's single event loop; there are no
+threads or processes per socket.
+
+A stub only hands out a fragment on an explicit request (an HTTP GET of
+/fragment, an FTP RETR of flag_fragment.txt, or a "fragment" line), so merely
+port-scanning a session does not collect its fragments. A stub only answers
+connections from the address the session's player connected from, so another
+participant cannot claim a session's fragments by finding its ports.
+"""
+import asyncio
+import collections
+import errno
+import ipaddress
+
+
+# Seconds an idle stub connection is kept before it is dropped
+STUB_IDLE_TIMEOUT = 30
+# Longest request line a stub reads
+STUB_MAX_LINE = 1024
+FRAGMENT_FILE = "flag_fragment.txt"
+
+
+def parse_port_range(text):
+    """Parse "START-END" into a pair of ports"""
+    start, _, end = text.partition("-")
+    start, end = int(start), int(end or start)
+    if not 1 <= start <= end <= 65535:
+        raise ValueError(f"Invalid port range: {text}")
+    return start, end
+
+def host_address(address):
+    """An IP address for comparison, with IPv4-mapped IPv6 addresses as plain IPv4"""
+    ip = ipaddress.ip_address(address.split("%", 1)[0])
+    return getattr(ip, "ipv4_mapped", None) or ip
+
+def service_kind(name):
+    if name in ("HTTP", "HTTPS"):
+        return "http"
+    if name in ("FTP", "SSH"):
+        return name.lower()
+    return "generic"
+
+
+class PortAllocator:
+    """Host ports shared by the listeners of every session in the process"""
+
+    def __init__(self, start, end):
+        self.free = collections.deque(range(start, end + 1))
+
+    def acquire(self):
+        if not self.free:
+            raise OSError(errno.EADDRNOTAVAIL, "listener port range exhausted")
+        return self.free.popleft()
+
+    def release(self, port):
+        self.free.append(port)
+
+
+class ServiceStub(asyncio.Protocol):
+    """One client connection to a session's service port"""
+
+    def __init__(self, listeners, port, name, description):
+        self.listeners = listeners
+        self.port = port
+        self.name = name
+        self.description = description
+        self.kind = service_kind(name)
+        self.transport = None
+        self.buffer = b""
+        self.idle_timer = None
+
+    def connection_made(self, transport):
+        self.transport = transport
+        if not self.listeners.allows(transport.get_extra_info("peername")):
+            self.reply(b"This service belongs to another player's session.\r\n")
+            transport.close()
+            return
+        self.listeners.connections.add(self)
+        self.idle_timer = asyncio.get_running_loop().call_later(STUB_IDLE_TIMEOUT, transport.abort)
+        if self.kind == "ftp":
+            self.reply(b"220 ProFTPD Server ready.\r\n")
+        elif self.kind == "ssh":
+            self.reply(b"SSH-2.0-OpenSSH_8.2p1\r\n")
+        elif self.kind == "generic":
+            self.reply(f"{self.name} {self.description} ready. Send 'fragment' to retrieve data.\r\n".encode())
+
+    def connection_lost(self, exc):
+        if self.idle_timer is not None:
+            self.idle_timer.cancel()
+        self.listeners.connections.discard(self)
+
+    def data_received(self, data):
+        self.buffer += data
+        while b"\n" in self.buffer:
+            line, self.buffer = self.buffer.split(b"\n", 1)
+            self.handle_line(line.strip().decode("ascii", errors="replace"))
+            if self.transport.is_closing():
+                return
+        if len(self.buffer) > STUB_MAX_LINE:
+            self.transport.abort()
+
+    def reply(self, data):
+        self.transport.write(data)
+
+    def fragment(self):
+        """Claim this port's fragment from the session, as bytes (empty once all parts are out)"""
+        part_number, fragment = self.listeners.session.service_connection(self.port)
+        if fragment is None:
+            return part_number, b""
+        return part_number, bytes(fragment)
+
+    def handle_line(self, line):
+        words = line.split()
+        command = words[0].upper() if words else ""
+        if self.kind == "http":
+            self.handle_http(command, words)
+        elif self.kind == "ftp":
+            self.handle_ftp(command, words)
+        elif command == "FRAGMENT":
+            part_number, fragment = self.fragment()
+            if fragment:
+                self.reply(f"Encoded part {part_number} of 4: ".encode() + fragment + b"\r\n")
+            else:
+                self.reply(b"No fragments left on this server.\r\n")
+            self.transport.close()
+        elif command in ("QUIT", "EXIT"):
+            self.transport.close()
+        elif self.kind == "ssh":
+            self.reply(b"Protocol mismatch. Send 'fragment' to read the message in the banner.\r\n")
+        else:
+            self.reply(b"Unknown command. Send 'fragment' to retrieve data.\r\n")
+
+    def handle_http(self, command, words):
+        # Only the request line matters; headers are not read
+        if command not in ("GET", "HEAD") or len(words) < 2:
+            self.http_response("400 Bad Request", b"Bad request\n")
+        elif words[1] == "/fragment":
+            part_number, fragment = self.fragment()
+            body = fragment + b"\n" if fragment else b"No fragments left on this server.\n"
+            self.http_response("200 OK", body, head=command == "HEAD")
+        else:
+            self.http_response("200 OK", b"Hidden directory: /fragment\n", head=command == "HEAD")
+        self.transport.close()
+
+    def http_response(self, status, body, head=False):
+        self.reply(f"HTTP/1.0 {status}\r\nServer: Apache/2.4.41\r\nContent-Type: text/plain\r\n"
+                   f"Content-Length: {len(body)}\r\nConnection: close\r\n\r\n".encode()
+                   + (b"" if head else body))
+
+    def handle_ftp(self, command, words):
+        if command == "USER":
+            self.reply(b"331 Anonymous login ok, send your e-mail as password.\r\n")
+        elif command == "PASS":
+            self.reply(b"230 Anonymous access granted.\r\n")
+        elif command in ("LIST", "NLST"):
+            self.reply(f"150 Listing\r\n{FRAGMENT_FILE}\r\n226 Transfer complete.\r\n".encode())
+        elif command == "RETR" and len(words) > 1 and words[1] == FRAGMENT_FILE:
+            part_number, fragment = self.fragment()
+            if fragment:
+                self.reply(f"150 Opening data for {FRAGMENT_FILE} (encoded part {part_number} of 4)\r\n".encode()
+                           + fragment + b"\r\n226 Transfer complete.\r\n")
+            else:
+                self.reply(b"550 No fragments left on this server.\r\n")
+        elif command == "RETR":
+            self.reply(b"550 No such file.\r\n")
+        elif command == "QUIT":
+            self.reply(b"221 Goodbye.\r\n")
+            self.transport.close()
+        else:
+            self.reply(b"502 Command not implemented.\r\n")
+
+
+class SessionListeners:
+    """The listeners of one session, bound on demand and released when it ends"""
+
+    def __init__(self, allocator, host="0.0.0.0", client_address=None):
+        self.allocator = allocator
+        self.host = host
+        # Address of the session's player; None lets anyone use the services
+        self.client = host_address(client_address) if client_address is not None else None
+        self.session = None
+        # Simulated port -> host port it is reachable on
+        self.ports = {}
+        self.servers = []
+        self.connections = set()
+
+    async def open(self, session):
+        """Bind a listener for each of the session's open ports"""
+        if self.servers:
+            return
+        self.session = session
+        loop = asyncio.get_running_loop()
+        try:
+            for port in session.open_ports:
+                info = session.port_info[port]
+                factory = lambda port=port, info=info: ServiceStub(self, port, info["name"], info["description"])
+                self.ports[port], server = await self.bind(loop, factory)
+                self.servers.append(server)
+        except OSError:
+            self.close()
+            raise
+
+    def allows(self, peer):
+        """Whether a stub connection from peer (a peername) belongs to this session's player"""
+        if self.client is None:
+            return True
+        try:
+            return peer is not None and host_address(peer[0]) == self.client
+        except ValueError:
+            return False
+
+    async def bind(self, loop, factory):
+        # Ports taken by something outside the allocator go to the back of the pool
+        for _ in range(len(self.allocator.free)):
+            host_port = self.allocator.acquire()
+            try:
+                server = await loop.create_server(factory, self.host, host_port, reuse_address=True)
+            except OSError as error:
+                self.allocator.release(host_port)
+                if error.errno != errno.EADDRINUSE:
+                    raise
+                continue
+            return host_port, server
+        raise OSError(errno.EADDRNOTAVAIL, "no free listener port")
+
+    def close(self):
+        """Stop listening, drop open stub connections and return the ports to the pool"""
+        for server in self.servers:
+            server.close()
+        for stub in list(self.connections):
+            stub.transport.abort()
+        for host_port in self.ports.values():
+            self.allocator.release(host_port)
+        self.servers = []
+        self.ports = {}
+        self.session = None
@@ -1,59 +1,335 @@
 #!/usr/bin/env python3
 import argparse
+import asyncio
+import base64
+import json
+import mmap
+import os
 import random
+import re
 import sys
-import base64
 import time
-import os
+from array import array
+from collections import OrderedDict
+from types import MappingProxyType
+
+import eventlog
+import flagimage
+import listeners
+import metrics
+import server
 
 
 treatment_mode = False
 debug_mode = False
 
+# Base64 payload served as the flag fragments
+PAYLOAD_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "payload.b64")
+_payload_parts = None
+# Per-instance flag written by setup_challenge.py, used for templated payloads
+FLAG_METADATA_PATH = "/challenge/metadata.json"
+PAYLOAD_CACHE_BYTES = 32 * 1024 * 1024
+PART_COUNT = 4
+
+# Port catalogs for the two conditions plus the shared non-default ports.
+# Read-only mappings: every session in the process shares the same objects.
+DEFAULT_PORTS_POPULAR = MappingProxyType({
+        67: MappingProxyType({"name": "DHCP", "description": "Dynamic Host Configuration Protocol server"}),
+        22: MappingProxyType({"name": "SSH", "description": "Secure Shell server"}),
+        80: MappingProxyType({"name": "HTTP", "description": "Hypertext Transfer Protocol server"}),
+        53: MappingProxyType({"name": "DNS", "description": "Domain Name System server"})
+    })
+DEFAULT_PORTS_UNPOPULAR = MappingProxyType({
+        556: MappingProxyType({"name": "RFS", "description": "Remote File System service"}),
+        1812: MappingProxyType({"name": "RADIUS", "description": "Remote Authentication Dial-In User Service"}),
+        6514: MappingProxyType({"name": "Syslog", "description": "System logging service"}),
+        389: MappingProxyType({"name": "LDAP", "description": "Lightweight Directory Access Protocol"})
+    })
+USER_DEFINED = MappingProxyType({
+        5000: MappingProxyType({"name": "vCenter", "description": "VMware vCenter Server management (TCP)"}),
+        2354: MappingProxyType({"name": "TFTP", "description": "Trivial File Transfer Protocol (UDP)"}),
+        668: MappingProxyType({"name": "IRC", "description": "Internet Relay Chat service (TCP)"}),
+        6423: MappingProxyType({"name": "RDP", "description": "Remote Desktop Protocol server (TCP)"})
+    })
+PORT_INFO = MappingProxyType({**DEFAULT_PORTS_POPULAR, **DEFAULT_PORTS_UNPOPULAR, **USER_DEFINED})
+
+# Every catalog port gets a fixed bit slot, so per-session port sets are int bitmasks
+PORT_SLOTS = tuple(PORT_INFO)
+PORT_INDEX = MappingProxyType({port: slot for slot, port in enumerate(PORT_SLOTS)})
+
+# Simulated pacing, in seconds
+SCAN_DOT_DELAY = 0.3
+CONNECT_DELAY = 3
+
+# Counters for every session in this process (--metrics-port, --metrics-file)
+server_metrics = metrics.Metrics(PORT_SLOTS)
+
+# Colour codes, stripped from --script results
+ANSI_ESCAPE = re.compile(r"\x1b\[[0-9;]*m")
+
+
+class RealClock:
+    """Wall-clock pacing; delays are awaited so they never block the event loop"""
+
+    def now(self):
+        """Current time, as recorded in the event log"""
+        return time.time()
+
+    async def sleep(self, seconds):
+        await asyncio.sleep(seconds)
+
+
+class VirtualClock:
+    """Instant pacing for tests and replays; sleeping only advances virtual time"""
+
+    def __init__(self, start=None):
+        # Virtual time starts at the wall time, so replayed events sort with real ones
+        self.current = time.time() if start is None else start
+
+    def now(self):
+        return self.current
+
+    async def sleep(self, seconds):
+        self.current += seconds
+
+
+def frame(*lines):
+    """Encode lines of static output once, print()-style"""
+    return "".join(f"{line}\n" for line in lines).encode()
+
+# Pre-rendered output frames. Static text and per-port lines are encoded at import,
+# so a command only joins cached bytes and the stream writes one buffer per response.
+PROMPT_FRAME = b"\nEnter command: "
+WELCOME_FRAME = frame(
+    "\n===== PORT SCANNING CHALLENGE =====",
+    "Mission: Identify and connect to 4 open ports on the target system.",
+    "Each successful connection will reveal part of the encrypted flag.",
+    "\nAvailable commands:",
+    "  scan              - Scan for open ports",
+    "  connect <port>    - Connect to a specific port",
+    "  status            - Display current progress",
+    "  help              - Display this help message",
+    "  exit              - Exit the challenge",
+    "\nThe ports you choose may affect your success. Choose wisely!",
+    "Good luck, hacker.\n",
+)
+SCAN_START_FRAME = frame(
+    "\n[+] Starting Nmap 7.94 ( https://nmap.org )",
+    "[+] Scanning target [10.10.X.X] ( Challenge Server )",
+    "[+] Initiating SYN Stealth Scan",
+    "[+] Scanning 65535 ports",
+)
+SCAN_DOT_FRAME = b"."
+SCAN_REPORT_FRAME = frame(
+    " scan in progress",
+    "\nNmap scan report for 10.10.X.X",
+    "Host is up (0.042s latency).",
+    "\nPORT         STATE   SERVICE",
+    "----         -----   -------",
+)
+MILESTONE_FIRST_FRAME = frame("\nMilestone: You found the first encoded part!")
+MILESTONE_ALL_FRAME = frame("\nMilestone: You found all encoded parts!")
+FRAGMENT_PREFIX_FRAMES = tuple(f"[+] Encoded part {n} of 4 found: ".encode() for n in range(1, 5))
+FRAGMENT_SUFFIX_FRAMES = tuple(
+    frame("", "[+] You need to connect to another port for the next part.") if n != 4 else b"\n"
+    for n in range(1, 5)
+)
+COMPLETE_FRAME = frame(
+    "\n🎯 Target successfully compromised! 🎯",
+    "\n\033[93mAnalyze the full string to reconstruct the final flag!\033[0m",
+    "\n\033[93mExample Approach:\033[0m",
+    "\033[92mYou might try writing a simple Python script that:\033[0m",
+    "          1) Takes the collected encoded flag fragments.",
+    "          2) Decodes each fragment (can you identify the encoding?).",
+    "          3) Assembles the decoded parts in the correct order.",
+    "          4) Maybe save the file with a specific extension?",
+)
+QUALTRICS_START_FRAME = frame(
+    "\n\033[95m--- *** QUALTRICS INFORMATION START *** ---\033[0m",
+    "\033[95mPlease copy/paste this information into a .txt file and upload to Qualtrics to receive compensation for this challenge.\033[0m",
+)
+QUALTRICS_END_FRAME = frame("\033[95m--- *** QUALTRICS INFORMATION END *** ---\033[0m")
+
+def render_scan_line(port):
+    """nmap-style report line for one open port"""
+    port_info = PORT_INFO.get(port, {"name": f"custom-{port}", "description": "User-defined service"})
+    service_name = port_info['name'].lower()
+    
+    # Format with proper spacing
+    port_str = f"{port}/tcp"
+    # Highlight the port number in bold yellow
+    return frame(f"\033[1;33m{port_str:<12}\033[0m open    {service_name}")
+
+def render_scan_footer(open_count):
+    return frame(
+        f"\n# Nmap done: 1 IP address (1 host up) scanned",
+        f"# {open_count} ports found open, {65535 - open_count} ports filtered",
+        "\nHint: The ports you choose may affect your success. Choose wisely!",
+    )
+
+def render_connect_banner(port):
+    """Connection output for one port, up to the simulated wait for the fragment"""
+    # Get port information
+    port_info = PORT_INFO.get(port, {"name": "Unknown", "description": "Unknown service"})
+    
+    lines = [
+        f"\n[+] Connection established to {port}/tcp...",
+        f"[+] Service banner: {port_info['name']} {port_info['description']}",
+    ]
+    
+    # Add some themed output based on the service type
+    if port_info['name'] == "HTTP" or port_info['name'] == "HTTPS":
+        lines += ["[+] HTTP response: 200 OK",
+                  "[+] Server: Apache/2.4.41",
+                  "[+] Content-Type: text/html",
+                  "[+] Discovered hidden directory"]
+    elif port_info['name'] == "FTP":
+        lines += ["[+] FTP response: 220 ProFTPD Server ready.",
+                  "[+] Anonymous login successful",
+                  "[+] Found file: flag_fragment.txt"]
+    elif port_info['name'] == "SSH":
+        lines += ["[+] SSH-2.0-OpenSSH_8.2p1",
+                  "[+] Found message in SSH banner"]
+    else:
+        lines += [f"[+] Connected to service: {port_info['description']}",
+                  "[+] Found hidden data in service response"]
+    lines.append(" scan in progress ...")
+    return frame(*lines)
+
+SCAN_LINE_FRAMES = MappingProxyType({port: render_scan_line(port) for port in PORT_SLOTS})
+CONNECT_BANNER_FRAMES = MappingProxyType({port: render_connect_banner(port) for port in PORT_SLOTS})
+SCAN_FOOTER_FRAME = render_scan_footer(len(DEFAULT_PORTS_POPULAR) + len(USER_DEFINED))
+
+
+def load_payload_parts(path=PAYLOAD_PATH):
+    """Memory-map the encoded payload read-only and split it into four zero-copy slices.
+
+    The mapping is made once per process, so every session (and every forked
+    worker) shares the same physical pages instead of holding its own copy."""
+    global _payload_parts
+    if _payload_parts is None:
+        with open(path, "rb") as f:
+            mapped = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        encoded_text = memoryview(mapped)
+        end = len(encoded_text)
+        while end and encoded_text[end - 1] in b" \t\r\n":
+            end -= 1
+        _payload_parts = split_parts(encoded_text[:end])
+    return _payload_parts
+
+def split_parts(encoded_text):
+    """Split the encoded text into PART_COUNT roughly equal slices; the last takes the remainder"""
+    part_length = len(encoded_text) // PART_COUNT
+    bounds = [i * part_length for i in range(PART_COUNT)] + [len(encoded_text)]
+    return [encoded_text[bounds[i]:bounds[i + 1]] for i in range(PART_COUNT)]
+
+def read_flag(path=FLAG_METADATA_PATH):
+    """The instance flag from the challenge metadata file"""
+    with open(path) as f:
+        return json.load(f)["flag"]
+
+def session_flag(flag, session_id):
+    """Make a flag unique to one session by tagging it with the session id"""
+    tag = f"{session_id:016x}"
+    if flag.endswith("}"):
+        return f"{flag[:-1]}_{tag}}}"
+    return f"{flag}_{tag}"
+
+
+class PayloadCache:
+    """Bounded LRU of templated payloads keyed by flag, evicted by encoded size.
+
+    Rendering and encoding a flag image happens once per distinct flag; sessions
+    keep their own reference to the parts, so eviction only drops the cache's copy."""
+
+    def __init__(self, max_bytes=PAYLOAD_CACHE_BYTES):
+        self.max_bytes = max_bytes
+        self.entries = OrderedDict()
+        self.size = 0
+
+    def get(self, flag):
+        parts = self.entries.get(flag)
+        if parts is not None:
+            self.entries.move_to_end(flag)
+            return parts
+        encoded_text = flagimage.encode_flag(flag)
+        parts = split_parts(memoryview(encoded_text))
+        self.entries[flag] = parts
+        self.size += len(encoded_text)
+        # Always keep the newest entry, even if it alone is over the limit
+        while self.size > self.max_bytes and len(self.entries) > 1:
+            _, evicted = self.entries.popitem(last=False)
+            self.size -= sum(len(part) for part in evicted)
+        return parts
+
+payload_cache = PayloadCache()
+
+
+def popcount(mask):
+    return bin(mask).count("1")
+
+
 class PortScanningChallenge:
-    def __init__(self, treatment_mode=False, debug_mode=False):
+    # Port sets are bitmasks over PORT_SLOTS; the catalogs are shared class attributes
+    __slots__ = (
+        "treatment_mode", "debug_mode", "stream", "clock", "open_ports", "open_mask",
+        "scanned_mask", "attempted_mask", "attempted_other", "connected", "encoded_parts",
+        "game_completed", "events", "session_id", "flag", "per_session_flag", "listeners",
+        "last_event",
+    )
+
+    default_ports_popular = DEFAULT_PORTS_POPULAR
+    default_ports_unpopular = DEFAULT_PORTS_UNPOPULAR
+    user_defined = USER_DEFINED
+    port_info = PORT_INFO
+
+    def __init__(self, treatment_mode=False, debug_mode=False, stream=None, clock=None, events=None,
+                 flag=None, per_session_flag=False, listeners=None):
         self.treatment_mode = treatment_mode
         self.debug_mode = debug_mode
-        self.scanned_ports = set()
-        self.connected_ports = list()
-        self.attempted_ports = set()
-        self.flag_parts = {}
+        self.stream = stream if stream is not None else server.ConsoleStream()
+        self.clock = clock if clock is not None else RealClock()
+        # Optional eventlog.EventLog receiving one record per command
+        self.events = events
+        self.session_id = int.from_bytes(os.urandom(8), "little")
+        # Templated flag for this session; None serves the static payload
+        self.per_session_flag = per_session_flag and flag is not None
+        self.flag = session_flag(flag, self.session_id) if self.per_session_flag else flag
+        self.scanned_mask = 0
+        self.attempted_mask = 0
+        # Attempted ports outside the catalog, created on first use
+        self.attempted_other = None
+        # Connected ports in connection order; the n-th connected port holds part n
+        self.connected = array("H")
         self.game_completed = False
+        # Optional listeners.SessionListeners serving the open ports over real TCP
+        self.listeners = listeners
+        # (event, port, result, fragment) of the most recent command
+        self.last_event = None
 
-        self.default_ports_popular = {
-                67: {"name": "DHCP", "description": "Dynamic Host Configuration Protocol server"},
-                22: {"name": "SSH", "description": "Secure Shell server"},
-                80: {"name": "HTTP", "description": "Hypertext Transfer Protocol server"},
-                53: {"name": "DNS", "description": "Domain Name System server"}
-            }
-        self.default_ports_unpopular = {
-                556: {"name": "RFS", "description": "Remote File System service"},
-                1812: {"name": "RADIUS", "description": "Remote Authentication Dial-In User Service"},
-                6514: {"name": "Syslog", "description": "System logging service"},
-                389: {"name": "LDAP", "description": "Lightweight Directory Access Protocol"}
-            }
-
-        
-        self.user_defined = {
-                5000: {"name": "vCenter", "description": "VMware vCenter Server management (TCP)"},
-                2354: {"name": "TFTP", "description": "Trivial File Transfer Protocol (UDP)"},
-                668: {"name": "IRC", "description": "Internet Relay Chat service (TCP)"},
-                6423: {"name": "RDP", "description": "Remote Desktop Protocol server (TCP)"}
-            }
-
-        
-        self.port_info = {**self.default_ports_popular, **self.default_ports_unpopular, **self.user_defined}
-
-        # Initialize open ports after port_info is defined
         self.open_ports = self.setup_ports()
-        
-        # Generate flag parts for each port
-        self.generate_flag_parts()
+        self.open_mask = 0
+        for port in self.open_ports:
+            self.open_mask |= 1 << PORT_INDEX[port]
+        # Flag parts are generated on the first successful connect
+        self.encoded_parts = None
     
+    def println(self, message=""):
+        """Write one line of dynamic output to this session's stream"""
+        self.stream.write(f"{message}\n".encode())
+
+    def log_event(self, event, port=0, result=0, fragment=0):
+        """Record a session event if an event log is attached"""
+        self.last_event = (event, port, result, fragment)
+        condition = 1 if self.treatment_mode else 0
+        server_metrics.record_event(event, condition, port, result, fragment)
+        if self.events is not None:
+            self.events.emit(self.session_id, event, condition, port, result, fragment, timestamp=self.clock.now())
+
     def debug_print(self, message):
         """Print message only in debug mode"""
         if self.debug_mode:
-            print(f"DEBUG: {message}")
+            self.println(f"DEBUG: {message}")
     
     def setup_ports(self):
         """Set up the 8 ports based on condition"""
@@ -71,161 +347,192 @@ class PortScanningChallenge:
         random.shuffle(all_ports)
         
         self.debug_print(f"Open ports: {all_ports}")
-        return all_ports
+        return tuple(all_ports)
     
     def generate_flag_parts(self):
         """Generate encoded flag parts"""
-        # Pre-defined encoded text (for demonstration purposes)
-        self.encoded_text =  "iVBORw0KGgoAAAANSUhEUgAAArcAAADpCAYAAAA+hh/ZAAAAAXNSR0IArs4c6QAAAARnQU1BAACxjwv8YQUAAAAJcEhZcwAADsMAAA7DAcdvqGQAACoFSURBVHhe7d15eBRVov7xtzuLJMCQQADZArJIJCq5yuqwKaOoRGZGYbziCC7MoLggwgOIOjoKCAg6wohcBxRk7qiAA7INiugYwGFTQIyEHQSSAAEDWcAk9Pn9cdP16650dzoQJBbfz/PUP31OdU6qa3nrVNUplzHGCAAAAHAAt/0DAAAA4OeKcAsAAADHINwCAADAMQi3AAAAcAzCLQAAAByDcAsAAADHINwCAADAMQi3AAAAcAzCLQAAAByDcAsAAADHINwCAADAMQi3AAAAcAzCLQAAAByDcAsAAADHINwCAADAMQi3AAAAcAzCLQAAAByDcAsAAADHINwCAADAMQi3AAAAcAzCLQAAAByDcAsAAADHINwCAADAMQi3AAAAcAzCLQAAAByDcAsAAADHINwCAADAMQi3AAAAcAzCLQAAAByDcAsAAADHINwCAADAMQi3AAAAcAzCLQAAAByDcAsAAADHINwCAADAMQi3AAAAcAzCLQAAAByDcAsAAADHINwCAADAMQi3AAAAcAzCLQAAAByDcAsAAADHINwCAADAMQi3AAAAcAzCLQAAAByDcAsAAADHINwCAADAMQi3AAAAcAzCLQAAAByDcAsAAADHINwCAADAMQi3AAAAcAzCLQAAAByDcAsAAADHINwCAADAMQi3AAAAcAzCLQAAAByDcAsAAADHINwCAADAMQi3AAAAcAzCLQAAAByDcAsAAADHINwCAADAMQi3AAAAcAzCLQAAAByDcAsAAADHINwCAADAMQi3AAAAcAzCLQAAAByDcAsAAADHINwCAADAMQi3AAAAcAzCLQAAAByDcAsAAADHINwCAADAMQi3AAAAcAzCLQAAAByDcAsAAADHINwCAADAMQi3AAAAcAzCLQAAAByDcAsAAADHINwCAADAMQi3AAAAcAzCLQAAAByDcAsAAADHINwCAADAMQi3AAAAcAzCLQAAAByDcAsAAADHINwCAADAMQi3AAAAcAzCLQAAAByDcAsAAADHINwCAADAMQi3AAAAcAzC7QWwZMkSuVwuNW3aVFlZWfbii+rgwYN69tln1bJlS7lcLmtq2bKlnn322YDtzcrKUtOmTf3qV2RasmSJ5LNcKjL16NFD+fn59iZp586d6tatm1wul6pXr66vvvpKkvTVV1+pevXqcrlc6tatm06ePGmftQxvu3y/x27Tpk3q3bu3IiIi5HK5FB0drQceeEA7duywV5UquR3hLv+GDRvqv//7v7V+/XoZY/y+284Yo7S0NHXt2lXR0dHW/5Samhp0/vz8fPXo0aPM3y1v8v7+oZw8eVK/+tWv5HK5NHHiRHuxJGnixIlyVWC78m3vwIED/coq8l3hLv9gUzj/f7i+++47paamqkaNGnK5XIqIiFCXLl20bNkynT171l5dkjRw4EC5XC653W598MEH9uIyQi03u+LiYi1ZskS33nqr1SaXy6UaNWro1ltvDdkuL2OMVqxYoc6dO1vzx8fHa/jw4UF/G+/vF2qqUaOGUlJSNGXKFJ06dcr+FeU6fvy4OnToEHQfpErezgM5deqUZs2apU6dOvkt3+joaOt/O378uH02P3l5eeratWuZ5WOfQv2fFeW7XAKt/xejTeGsM/bJd/333Q8E20fZBfutfb+rRYsW2r9/v998gQRapr7fc/XVV+uzzz4LuO++FBFuLxEnTpzQ7373OyUmJmrcuHHas2ePX/mePXs0btw4NW3aVFOnTi33gHQxHTx4UL1799bq1avtRX5Wr16tmTNn2j+uEGOMpkyZovbt22v58uXyeDxS6UF99uzZuuaaa/TPf/7TPpufymhHOLKysvTBBx+oU6dOuueee4IeaIuLizVkyBB1795da9asUXFxsfX5smXL1KlTJw0ZMsT6/EIzxmj69OlatWqVvQilvOthcnKyli1bpoKCAkmSx+PR2rVrlZqaqtTU1KC/uUq/44UXXtChQ4fsRRVmjNHSpUuVkJCgPn366OOPP7baJEkFBQX6+OOPlZqaqq5duwY9eHvXxdtuu03r1q2zPs/NzdWrr76qa6+9Vps2bfKbJ1wFBQXaunWrRowYoSZNmuhf//qXvUpQxcXFevrpp7Vx40Z7UVCVuZ0XFxfrlVdeUUJCggYNGqT169f7Ld/i4mLrf0tISNDYsWODbq8nT57Uvn377B9fVFWxTRfL3r17NXHiRJWUlNiLKiQ9PV233Xab1qxZYy+6JBFuLwEHDhxQt27dNH/+fEnSoEGD9O2336qoqEjGGJ0+fVqLFi1ScnKyiouLNXToUE2ZMsU6A6xXr542btyozMzMMlPfvn0lSZ06ddKuXbvKlGdmZurmm2/2a48kzZkzp0y9QNOHH36o6tWr+827fPly7d69W61atVJGRoYKCgp0/fXX+9XxGjt2rDZv3mz/OGyffvqpRo4cKUl65JFHlJOTI4/Ho/T0dHXr1k3FxcUaPHiw0tPT7bP6Od92ePXt27fMMsrMzNS2bdv0+uuvKzExUZL0wQcf6K677goYdqZOnaoZM2ZIpf9Tdna2jDHKycnRqFGjJEkzZszQ1KlTbXP+f6F+b/sU6Pf3tWHDBo0dO9b+cZVxIdb/ilqyZIm1Hvbp00e7du2Sx+NRfn6+pk2bpqioKK1YsUKjR48OeZDMyMjQuHHjQtYpjzFGr776qu644w6dOnVKLVq00HvvvaecnBwZY+TxeLRv3z4NHTpUbrdb//nPf3TLLbfowIED9q/SrFmzNGPGDLndbo0fP175+fkqKSlRWlqakpKSlJOTo/vvv19Hjx61zypJiomJ0YoVK8os84MHD2r58uW67777pNIe0NTUVH344Yf2ryijuLhY48aN09/+9jd7UbkqYzs/efKk+vfvr5EjR6q4uFhJSUl+y9cYox9++EGLFi1SSkqKJOm5557To48+GjDg7t+/X0eOHFFcXJzS0tLKLCvvFGhfe6FczDYFW2cCTa+//rp99gvirbfe0vLly+0fl6tBgwY6cOCAjhw5ohtvvFFFRUXWcf6SZ+Boubm5pmfPnkaSiYuLMytXrrRXsfjWdbvd5pNPPrFXKWPAgAFGkunevbvJy8uzF/tZvHixkWQkmcWLF9uLw/bQQw8ZSebxxx+3F5lNmzaZ2NhY6+9IMqmpqaawsNBe1eJtV2xsrNm0aZP1eWFhoenVq5eRZPr162eKior85svJyTHt27c3ksyjjz5qPB6PVVaZ7cjMzDSJiYlGkhkwYIDfPHaFhYXW8pFkJkyY4FeenZ1tkpKSjCTz8MMPm+LiYr9yj8djHn30USPJtGnTxhw7dswqy8vLM927dzcK8/cOR25urunatavfcrK32WvChAlGkklMTDSZmZn24jJ822tfbhX9rmAqsv6fK9/18Oabbw74d6ZNm2Ykmdq1a5vvvvvOr8zbRu9U3rYdarkZY8yCBQuM2+02kszvf/97k5+fb69i8a1rX/9918Vnn33Wb/sxxphdu3aZBg0aGElm2rRpfmXe38++rQSydu1aExcXZySZli1bmu+//95exXL8+HHTr18/v+UV6retzO3clG5/Q4cOtb7r+eefL7Pf8eW7vQf7XWfMmGEkmXbt2pkTJ07Yiy8I3+USaF9/MdpUkXUmEN/9cLB9lF2w39r3u7xTcnKyOXLkiN/8vsJdpj179gy5TV4q6Ll1uPfee0+rVq2S2+3WzJkz9atf/cpexVKrVi3NmDFDDRo0kMfj0ZQpU3T69Gl7tYvO2zvRqFEje5Gfa6+9VpK0dOlSzZkzx15cri1btujzzz9XZGSknnjiCUVFRfmV16lTR0899ZQkadGiRUEvvZ5vOyoiJiZGU6ZMUc+ePSVJ06ZN87v8l5ubq7p16+ryyy/Xvffeq8jISJ+5JZfLpV69ekmlvSuBetsqizFGkydP1urVq3XjjTeqbt269ioo7XWsUaOG4uPjNXDgQNWoUcNeRZ07d1ZsbKxOnDih3bt324ul0h7o+Ph4eTweDRs2LGhvaChHjx7V888/L4/Ho549e+qvf/1ryJ61O++8U2PGjJEkLVu2TF988YVV9vnnnysjI0OXX365HnjgAblcLp85pZYtW+qPf/yjJOnvf/97wKsQ4bjhhhs0c+ZMud1u7d69W7NmzbJX0dmzZ/Xee+/piiuu0Pz58xUVFaWmTZvaq4VUGdv5mjVr9Oabb0qS/vCHP+iZZ54ps9/xFRMTo4kTJ6p9+/byeDx6++23y/TKe68qXXnllYqLi/Mru1iqYpsulqSkJLlcLqWnp2v8+PHnfM9sw4YNJUklJSXn/B1OQrgNwnvzdtOmTXX48GF99tlnuvrqq60bzZOSkvTuu+8GDH/lPVBWXFys999/3+/7atSooQceeKDMvbBeZ8+e1bJly9SlSxe/h5puvfVWpaWlBVyZT548qdmzZ0uSbr75Zt1+++32KmW0aNFC/fr1U3Jysrp162Yv/lkZMWKEunbtKkl68cUXgx70g/nPf/6joqIiXXnllUpKSrIXS5Latm2r2rVr6/Dhw8rIyLAXS5XQjoqqVauWRowYIZfLpcOHD+uTTz6xylq3bq20tDRlZWWpS5cufvPZRURElAm/lWnNmjWaNGmSmjdvrrFjxyomJsZeBZLq16+vBQsW6MSJE7r33nvtxWUE+82uuuoqTZo0yTqQTps2LeB+I5TPPvtM6enpcrlcGjFihGrVqmWv4sflcunuu+9W8+bNdeeddyo+Pt4q+/TTTyVJ1113nXVgtuvSpYtcLpe+++67oCeP4bj99tut20Pmz5+vnJwcv/ItW7Zo0KBBOnXqlNq3b68tW7bokUce8atTnvPdzktKSjR9+nQVFRWpUaNGevrpp0MGW686dero/vvvV+vWrdWxY0e/WxMKCgr03XffSZKuv/76MicQF0NVbNPFdO+991oPrr355pvcM1tJCLflOHv2rCZPnqyePXv63Ve5Y8cODRw4UHfeeWeFehQOHTqkG264Qffcc4/f9xUUFGj27Nm66qqryjyg5H0YLDU1VWvXrvV7qOnjjz9W9+7d9eCDD/o9cCBJ27Zts57Q/O1vfxtWeHC5XHr99df17bffasyYMWHNU1XFxcVp3Lhxio6OVlZWlsaMGRPwnrRgtm7dKklq1qxZwN4ySVYvqCR988039mKpEtpxLtq1a6errrpKkoKe/ARSXFxsrX9t2rRRs2bN7FUqxdGjR/XII4+ouLhY48eP1xVXXGGvgjAZY/TJJ5+osLBQjRo1CnoiptL9gPc+4UmTJlXoQFpSUqIFCxZIpUG5Xbt29ioBXX311dqzZ48WLFigjh07SqUjMnjDX4sWLVStWjXbXP+nUaNGio+PV15enr7//nt7cdhiYmL029/+VpK0b9++Mg8zRUZG6o477tC6deu0fv16tWnTxq88HOe7nR88eNB6SPY3v/lNhba9IUOGKCMjQ08++aTfPvvUqVPatWuX1dkyatQo1a9fXy6fkTYqsn+oDFWxTRdTVFSUnnnmGTVo0EBFRUUaPnx4uSNgoHyE23IcPnxYf/nLX9SkSRN98sknKikpUW5ursaPHy+32x3WQxxe+fn5evDBB7Vp0yZFRUVp2rRpys3Nlcfj0datW5WSklLmAaXTp09r4MCB+uc//ym3260XXnjBerAgOztbjz32mCRp9uzZGjZsmN/OdMOGDSopKVFMTIyuu+466/NLSZcuXawHcRYsWFDmxCGYM2fOWL07CQkJQQ++1apVsy6n79q1y15sOdd2nKu4uDgr3O7cuVO5ubn2Kn6Ki4u1du1a9erVS7Nnz5bb7daYMWPK7Zk7F8YYjR8/Xunp6dYJIiru7Nmz2rZtm/r3729d+h82bFjIE4XLLrtM48ePtw6kzzzzTNgn58ePH7celkpJSVGdOnXsVcJ25swZHTt2TCrn9qK4uDjrxDLU9hWO5ORkRUZG6vTp09q5c6dfWdu2bfX++++rY8eO59WTeD7beUZGhg4fPixJuummm86rHV6HDh3SsWPHZIxRv379NGnSJOt2FO9IG927d/9JR0epim262Fq2bKlJkyZJkjZu3Ki33nrrkgn3FwrhNgzNmzdXWlqabr75ZkVERKhWrVoaPXq0Xn75ZUnS22+/HdaQMUuXLtXKlSvldrv13nvv6bHHHlOtWrXkcrl07bXXauHChWrevLlycnKsJx4/+ugjLV26VCp9svhPf/qTdVCpX7++pk6dao25N2vWLP373/+2/p73Ml7t2rXVoEED6/Ofs/z8fOs+0HDu1XK5XHr88ceVnJwsY4zGjBkT1uXNkpISqyc81KXBatWqKSEhQfK5FziQc23HuYqMjLTuhTx69KjOnDljr2IZOHCgoqOj1aVLF33++edq0KCBVq1apT59+tirVopPP/1U06ZNU/PmzfX888+HXL4IbOLEiYqMjNS1116r999/X9HR0frHP/5h3QMeSsuWLfWnP/1JKh2+avr06WEdSE+cOGGdJCUnJ59X+CouLrbGLw31+1erVk316tWTytm+whETE6Po6GipNGBdCOeznW/fvl2SFBsbW+H7fYPZuXOndetc8+bNtWLFChUVFVkjvnhvVZsxY4Zee+21sNaD81UV21QV3HXXXUpNTZVKR93YsGGDvUpI8fHxioyM1L59+5SXl2cvvuQQbsMwbNiwMpeIXKUDPCclJamoqEgff/yxX7md7yW9YPe/NmvWTP3791fdunV14sQJFRYWWvP06tVLd999d5kDim87PB6P34DZ3h6ZiIgIRURE+Mx18fXp00euAINm+06BBv8+duyYdu/erejoaOsBjvLUq1dPr732mtxu9zmNKdiqVSv7RxbfEFme821HRTVu3Nj+URm+PdReWVlZeuSRR0KesH3xxReqWbNmmd/Mdwo0APuhQ4f0xBNPSKWXxe3bFcLj7eHzKioq0tChQ7Vs2bKwwsDAgQOtA+mkSZO0ZcsWe5UyCgsLrZOkytyfhNq+oqKiwt6+yhMfH69f/OIX9o8r3blu597wXq1aNcXGxtqLz0l2drbq1q2rpKQkrVq1Sr169VJUVJRcLpfatGmjRYsW6f7775ckvfzyy+UOaVgZLnabCgsL1a5duzL7K9/J/tKFn0JMTIwmTJighIQEFRYW6rnnniuz/wylUaNGql+/vrKzs8M+oXIywm05atasaT0kYFe/fn116NBBKr2UEKp3LDc31zoz79atW9B7WV966SUdPXpUU6dOVV5ennUZMNQ89evXtx6W2Lx5s2PP2vbt26cnn3xShw8f1q9//euw7/mTpBtvvNF68vpcxxSsDD9lO8JZDy677DK9//778ng8Kioq0sKFC9WkSRNlZGTolltuqXDvQSglJSUaN26cMjIy9NBDD12wnuFLgXes2pKSEq1du1YpKSk6duyYfv3rX4d1KTwmJkYvvvii4uLilJubq1GjRlXoQPpz9OOPP6qoqMj+8QVxobbzcN4S6NspMHz4cB09elTbt28P2BscFRWl4cOHW+vBsmXL7FUqXVVsU1WRnJys0aNHS5JWrlyp//mf/7FXCapZs2Z64oknVFRUpCFDhuibb74J60TXqQi35YiPj7cuiwXiffDg6NGjAUdO8Dpz5ozVk3rNNdfYiwMqKChQYWGhFMY83vvWvv/+e+sg5e25KyoqCtm2iyGclzj4Dn4/ceJENW/eXIsXL9bjjz+ud955J+TlTLvIyEiNHj1arVq1ksfj0ZgxY8IeCinUvX6+ty+E43zaUVHh3EvpcrmsHtioqCj95je/0YIFC6wDy2uvvRaw1ynUSwu8k30A9uXLl+utt95Sq1atyh3iCKHVrFnTuiJzww03aNGiRdY69corr4T126ekpOjpp5+WSg+kf//73+1V/Pj2fJ7L62yDCbV9FRcXV2j7CsW35/lCO5/t/MyZM9Z+/6fQtGlTXX311VLp652rggvZpnBe4rB3796wrwxWtkGDBllDOU6YMCHsnmuXy6Vhw4Zp0qRJSk9PV9u2ba0e8EsR4baSlHdf45EjR/TDDz/YPw7phx9+OK+DiDd45+TkKDMz0158UcXHx6tBgwYhp2APcZ2rpk2b6qWXXpIrjDEFfW83CHWvn+9l/XDDWkXaca4KCgqsS9eJiYlBR3sIpH379taQU19++aX14I+vyy67TJdffnmZ38x3qlOnjlylt9EcOHBAI0aMkEovNQbqsalsBQUFOnjwoP1jR2ratKl1u8e2bdvCGobK5XJp8ODB1pWp5557LuSBND4+3jph3rFjR8CTnnBFRUVZ62R525c3FIa7fQVz9OhRKzSGuhWislR0O/eGqcLCwqBBuHr16vrwww/LhLEVK1YEvbJXnqioKOuk5cCBA1WiB/9CtsnlcikhIaHM/sp3ql+//nmvbyrnxC2YWrVqady4cYqNjVVOTo5Gjx5d5Tqnfg4It5XkiiuuUM2aNe0fW87lfq9zmcdXUlKSYmNjVVJSEvKgZbdmzRolJSVp6NChQcdu/amNGjVKe/fuVdeuXTVt2jSNGDHinA6ud955Z1hjClarVk0NSh/Cy8nJCXri4vvUd0UOmOG241zl5uZaAadly5YVCrcul0udO3eWKvHE6JtvvrFeGdu3b98yl1IbNmxoDfU0evRouQKME+092Pzwww9BD/6+PB6PtY60bt3aXuw4KSkpioyMVGFhYdi/Wa1atfTKK69YB9I///nP+vHHH+3VpNIHOL29adu3by93BA6vkpIS9e/fXzfddJPmzp2rH3/8UTExMdb2Zb9/2Fdubq4VbCqyfQXiHaqvMh/YKk9FtvPWrVtbwwoGq+dyuVSnTp0yYSwhIcE6kfRljNHx48dDhsOzZ89av3mokWEqS1VsUzjcbrc1hnS4odV74hYfH6/69evbi4Pq0KGDnn32Wan0QfRwXhut0lerjxw5Uk2aNNHmzZutce4vRYTbcoS6pG+MsXaY5W2A1atXtx4SCHWZZcmSJapRo4a6du2qoqIi1a5dWyrtjQnFe4DwDdktW7a0bmdYuHBh0P/DlzFGS5Ys0Y4dOzRz5sxKuyRYGa644gpNnz5dcXFxmjdvXtg7GF9RAcYUtD9Q5dW+fXupdNSJYDviY8eOKTs7W/LpeQlHRdpxLlavXm2NKtGrVy/rwDdjxgw1bNhQbdu2Dfn3jhw5IlXywy3nyzu0WX5+fsDeZDvvkEMqHej+5+rTTz9V48aN1ahRI+u+/UDy8vJUUlIil8tVoV68Dh06WKMszJ8/X++//769imR7e9327du1adMme5WA9u3bp08//VSff/65PvvsM0VHR6t69erWlaU9e/YEPXk8fPiwfvjhB9WsWVOJiYn24rCdPHlSCxculEpv8WrZsqW9ygVRke08MTFRPXr0kCTNmzfvvK86ZGVlqVmzZkpISLBG9gnk9OnT1klkw4YNg74EpDJUxTaFq0aNGtYwe1lZWUHXWS/ffFCrVq2Q+cDO5XLpj3/8o3UMGjlyZLnHu5ycHL399ttyuVx64403lJKSEvCE51JBuC1HdnZ20Idqjh49qq+//loqDUKhNsA6derov/7rv6TS104GC5rr1q1TQUGBIiIidPnll1sH9MWLFwe9j+7IkSNauXKlZOulq1WrlnXPzSeffKLFixf7zRfInj17NHfuXKl0rMVzGcz8QmrWrJnatm0b8jWj5bGPKfiXv/zFXkUqDavR0dHauXNn0B7srVu36sSJE+UOnh9IuO2oqJMnT2r69OlSae/9jTfeaJV5e0O3bdsWNJyUlJRYIyU0b97c6k06H3fccYeMMUGnzMxMK7xMmDBBxhgdOHDA6t2TT8+WMUaLFi0KeYlXpa97PX36tGJjYyv08GFVU7duXZ06dUqZmZlatWqVvdiyfv16qfQB0+bNm9uLg3K5XHryySetA+lzzz0XNETfdNNN1jBX48ePD7pP8jLG6N1339WxY8fkdrvVv39/64B7ww03SJK+/vrroD3Na9askTHmvF8osmLFCms//vvf//6CjN8cTLjbeWRkpIYMGaLo6Gjt3r1bL730UshbNsoTHx9v9bSvWrUq6G+1adMmbd++XS6XK+AoPpWpKrYpXNWrV7deQvLll1+We/zZv3+/9brpDh06VPgEu06dOpoyZYr1UpBnn3025AOR3peTNGnSRG3btrUXX3IIt2GYPn16mY3QGKM5c+YoIyNDCQkJ1rA6wURGRlpvBlq5cmXAp2f3799v9Zr07dtXcXFx1jzr16/XwoULyxzQfdvhdrt19913+5Xfc8896tmzp4wxevjhh/Xll1/6lfvKzs7Wgw8+qKysLEVHR2vkyJEV6gH6KfiOKxuqB7w8vmMKBnuzWEpKim688UaVlJRo6tSpZQ40x48f16uvvipJuvXWW9WkSRO/8nCE046KOH36tIYPH2696Wjo0KF+l8Ouu+46JSUlyRijN954I+BJ1kcffaR58+ZJpeuh7ytTLybfnq0333wz5KgAGzZs0Ouvvy5J6tq1a5U7SauIK6+80gqCM2bMCHhLhu//27t37wr3ctapU0fjxo2T2+0OedtHvXr19Oc//1lut1urV6/W8OHDA65D8tk3jR8/Xipd172/n0pHFEhKSlJ2drbeeeedMvu23bt366233pJK36x2roH0yy+/1MMPPyxjjJKTk/W73/3OXuWCC3c779Kli/Xa37/97W8aNWpU0OXrdejQIb344otlHkKrVq2a7rjjDql0/VixYoVfuUpPhCdPnixjjDp06GDdjnShVMU2VURqaqqio6OVm5urJ598skwu8CouLtbLL7+sw4cPy1X6Cupz6UX1XR/27NkT8la87OxsnT59WvXq1atQL7FjGQS0adMmExsbayQZSaZ9+/Zm69atxuPxmJycHDNq1CirbOLEicbj8VjzLl682EgyiYmJJjMz0/o8Ly/P3HzzzUaSiY2NNXPmzDGnT582JSUlZvPmzSYlJcVIMsnJyebIkSPGGGMKCwtNamqqkWTcbrd54YUXTE5OjjHGmOzsbPPYY49Z7fjDH/5gioqKrL/ntXnzZtOkSROr3n333We2bNli1c3JyTEzZ840v/jFL4L+T8EMGDDASDLdu3c3eXl59mI/3uUiySxevNheHDbv35wwYYK9yO93K+9vfP311yYuLs5qU2xsrNm0aZNfnY8++si43W4jyfTp08fs3bvXeDwek56ebjp37mwkmYSEBPPtt9/6zVeZ7cjMzDSJiYlGkunbt6/JzMwsM61fv96MGzfOqqcQ68PcuXOtOt7/yRhjcnNzzcsvv2yioqKMJNOzZ0+Tm5trzZeXl2e6d+9uFObvXRG+/2Og39XLvqzuu+8+s3LlSms5rFy50gwYMMD6zeLi4sz69evtX2MmTJhgJJmGDRuaLVu2lFme9inY/1qR9f98pKWlmejoaCPJpKSkWPui06dPm7lz51rbbqtWrcz+/fv95g23jcXFxebhhx+2lq0kM2DAAHs1U1RUZIYPH27VSUxMNO+88461XyoqKjJbtmwxffr0seoEapcxxkyePNmq88gjj5icnBxTUlJi0tLSTPPmzY1s+0Mv7+8XExNjVqxYUeb32r9/v5k3b57p27ev9f3B1oVgvH8j1HKrzO3cq7Cw0AwePNhv+c6YMcMcPnzY2ifn5eWZf/3rX+bWW2+16kkyjz/+uMnPz7e+Kzc31/Ts2dNIMlFRUWbatGkmPz+/zDEnOjrapKWl+bTi/IRaLherTd7fM9hyD4d9G0lMTDRvvPGG2blzp8nMzDQ7d+40b7zxhmnRooVVJ9B+ONz9nTHGHDx40CQlJfn9zvZlanyOr6HW10sJ4TYI78YZGRlpevXq5bdi+U4PP/xwmRU3WLg1pStqu3btynyPd2rSpInZvHmz3zzHjx83t9xyS5m6vtP999/vt1Oz27dvnxXGQk1RUVFmzpw5YQVbU4EDp6mC4dbYDq6Bdnoej8evjn2KiooyH374od88ppLb4bsjDHeyH+R8lZSUmIkTJ5aZx3fq3LmzOXjwoN98VSHcGmPMhg0b/E7Wgk0JCQlm1apV9tmN8TnQhTsFa1NF1v/z4fF4zLx586wTj0BTixYtyuw7TAXbaD+QBgq3pnQdev3110O2xzv17NnTZGVl2b/CmNIgbA/UvlNCQoLZuHGjfbYK/34tWrQw//73v+1fE1Jlh1tTznbuq6SkxPzjH//w63AINfl2vtjt37/fJCcnl5nHOwXbh52P8pbLxWhTZYRbU3ryMWzYsDJtDjQFOy5XZH9nbJ0sCrJMCbf+uC2hHNHR0Ro7dqwWLFhgPXHtdrv1y1/+Ul988YWmT59eoSFDGjdurLS0NM2ZM0fJycnW5/Xq1dPIkSP17bffKiUlxW+e2rVra/ny5Vq6dKl++ctfyu3+v58tKipKvXv31rp16/T222+HfJNPs2bNtHr1aq1du1Z333236tata5W53W5dc801mjx5snJycjRgwIBzuoTyc+Q7pmAgLpdLTz31lNatW6fbb7/db9nff//92rZtm+688077bBVWXjvK43a71bJlS+vBg6lTpwZdHyIiIjRy5Eilp6erd+/e1vrrdrvVoUMHzZ8/X1988UVYbzi7GNq3b68dO3bof//3f9WxY0e//zMqKkodO3bU3LlztX//ft10001+8/5cuVwu9evXT3v37tWgQYP8/ufk5GRNmzZNW7duLbPvqKjGjRtr7Nix1noeTEREhJ544gllZWVp8uTJatu2rd9+MD4+XnfffbfWrVunlStXBr1vOyoqSn/961+1dOlSderUyfo8Li5OTz31lL755ptzvl86Pj5evXr10vz587Vt2zZ1797dXuUnF+52HhERoXvuuUc5OTlavHix7rrrLr/bg3y39x07dmj9+vW69tprA+63mzZtqo0bN2rq1Klq0aKF9Xm9evU0ZMgQ7d27t1L2YRVRFdsUrpiYGL366qvKyMjQ4MGDy9wC1LBhQw0ePFjp6enlHpfDddttt+mhhx6yf4wQXMZ+oxMkSV999ZW6desmSUpLS9P1119vr4KLZODAgXr33Xc1YcIEjRo1yl4MAMAlZcmSJerTp4+6d++upUuXVmj4RycKfXoOVEHeHvTyhkYBAOBS4D0eljcs6aWCcIufHe8A7J9//nnQIYsAALgUZGZmWuM4t27dOuSwpJcKwi1+drp3766kpCTt3btXbdq0UfXq1fXVV1/ZqwEA4FhZWVlq2rSpGjVqpDVr1ighIUH9+/e3V7skEW7xs9O4cWN99NFH6tq1q70IqFLy8/PVo0cPuWyvGw536tGjR9C34wGVrSqur1WxTVVR+/bttWjRIr8H1S9lPFAGABdIQUGBHnrooZAvTwnlhhtu0KxZsyrliWugPFVxfa2KbULVR7gFAACAY3BbAgAAAByDcAsAAADHINwCAADAMQi3AAAAcAzCLQAAAByDcAsAAADHINwCAADAMQi3AAAAcAzCLQAAAByDcAsAAADHINwCAADAMQi3AAAAcAzCLQAAAByDcAsAAADHINwCAADAMQi3AAAAcAzCLQAAAByDcAsAAADHINwCAADAMQi3AAAAcAzCLQAAAByDcAsAAADHINwCAADAMQi3AAAAcAzCLQAAAByDcAsAAADHINwCAADAMQi3AAAAcAzCLQAAAByDcAsAAADHINwCAADAMQi3AAAAcAzCLQAAAByDcAsAAADHINwCAADAMQi3AAAAcAzCLQAAAByDcAsAAADHINwCAADAMQi3AAAAcAzCLQAAAByDcAsAAADHINwCAADAMQi3AAAAcAzCLQAAAByDcAsAAADHINwCAADAMQi3AAAAcAzCLQAAAByDcAsAAADHINwCAADAMQi3AAAAcAzCLQAAAByDcAsAAADHINwCAADAMQi3AAAAcAzCLQAAAByDcAsAAADHINwCAADAMQi3AAAAcAzCLQAAAByDcAsAAADHINwCAADAMQi3AAAAcAzCLQAAAByDcAsAAADHINwCAADAMQi3AAAAcAzCLQAAAByDcAsAAADHINwCAADAMQi3AAAAcAzCLQAAAByDcAsAAADHINwCAADAMQi3AAAAcAzCLQAAAByDcAsAAADHINwCAADAMQi3AAAAcAzCLQAAAByDcAsAAADHINwCAADAMQi3AAAAcAzCLQAAAByDcAsAAADHINwCAADAMQi3AAAAcAzCLQAAAByDcAsAAADHINwCAADAMQi3AAAAcAzCLQAAAByDcAsAAADHINwCAADAMQi3AAAAcAzCLQAAAByDcAsAAADHINwCAADAMQi3AAAAcAzCLQAAAByDcAsAAADHINwCAADAMQi3AAAAcAzCLQAAAByDcAsAAADHINwCAADAMQi3AAAAcAzCLQAAABzj/wHJaHGr39vKtgAAAABJRU5ErkJggg=="
-        
-        # Split the encoded text into roughly equal parts
-        part_length = len(self.encoded_text) // 4
-        self.encoded_parts = [
-            self.encoded_text[i:i + part_length] for i in range(0, len(self.encoded_text), part_length)
-        ]
-        
-        self.flag_parts = {}
+        if self.encoded_parts is None:
+            if self.flag is None:
+                # Pre-defined encoded text (for demonstration purposes), shared by all sessions
+                self.encoded_parts = load_payload_parts()
+            elif self.per_session_flag:
+                # No other session has this flag, so caching it would only evict the shared one
+                self.encoded_parts = split_parts(memoryview(flagimage.encode_flag(self.flag)))
+            else:
+                self.encoded_parts = payload_cache.get(self.flag)
+        return self.encoded_parts
+
+    def invalid_attempts(self):
+        """Attempted ports that are not open in this session"""
+        closed_mask = self.attempted_mask & ~self.open_mask
+        ports = [port for slot, port in enumerate(PORT_SLOTS) if closed_mask >> slot & 1]
+        if self.attempted_other is not None:
+            ports.extend(self.attempted_other)
+        return ports
+
+    @property
+    def scanned_ports(self):
+        return {port for slot, port in enumerate(PORT_SLOTS) if self.scanned_mask >> slot & 1}
+
+    @property
+    def attempted_ports(self):
+        ports = {port for slot, port in enumerate(PORT_SLOTS) if self.attempted_mask >> slot & 1}
+        if self.attempted_other is not None:
+            ports.update(self.attempted_other)
+        return ports
+
+    @property
+    def connected_ports(self):
+        return list(self.connected)
+
+    @property
+    def flag_parts(self):
+        return dict(zip(self.connected, self.generate_flag_parts()))
     
     def print_welcome(self):
         """Print welcome message and instructions"""
-        print("\n===== PORT SCANNING CHALLENGE =====")
-        print("Mission: Identify and connect to 4 open ports on the target system.")
-        print("Each successful connection will reveal part of the encrypted flag.")
-        print("\nAvailable commands:")
-        print("  scan              - Scan for open ports")
-        print("  connect <port>    - Connect to a specific port")
-        print("  status            - Display current progress")
-        print("  help              - Display this help message")
-        print("  exit              - Exit the challenge")
-        print("\nThe ports you choose may affect your success. Choose wisely!")
-        print("Good luck, hacker.\n")
+        self.stream.write(WELCOME_FRAME)
     
-    def scan_ports(self):
+    async def scan_ports(self):
         """Simulate port scanning with realistic nmap-like output"""
-        self.scanned_ports = set(self.open_ports)
+        self.scanned_mask = self.open_mask
         
-        print("\n[+] Starting Nmap 7.94 ( https://nmap.org )")
-        print("[+] Scanning target [10.10.X.X] ( Challenge Server )")
-        print("[+] Initiating SYN Stealth Scan")
-        print("[+] Scanning 65535 ports")
+        self.stream.write(SCAN_START_FRAME)
         
         # Simulate scan delay with progressively appearing dots
         for _ in range(3):
-            sys.stdout.write(".")
-            sys.stdout.flush()
-            import time
-            time.sleep(0.3)
-        print(" scan in progress")
-        
-        print("\nNmap scan report for 10.10.X.X")
-        print("Host is up (0.042s latency).")
-        print("\nPORT         STATE   SERVICE")
-        print("----         -----   -------")
-        
-        # Sort ports for more realistic output
-        # maybe we want the ports to be randomly sowned 
-        # sorted_ports = sorted(self.open_ports)
+            self.stream.write(SCAN_DOT_FRAME)
+            await self.stream.drain()
+            await self.clock.sleep(SCAN_DOT_DELAY)
         
+        # Ports are listed in their shuffled order, not sorted
+        write = self.stream.write
+        write(SCAN_REPORT_FRAME)
         for port in self.open_ports:
-            
-            port_info = self.port_info.get(port, {"name": f"custom-{port}", "description": "User-defined service"})
-            service_name = port_info['name'].lower()
-            
-            # Format with proper spacing
-            port_str = f"{port}/tcp"
-            # Highlight the port number in bold yellow
-            print(f"\033[1;33m{port_str:<12}\033[0m open    {service_name}")
-        
-        print(f"\n# Nmap done: 1 IP address (1 host up) scanned")
-        print(f"# {len(self.open_ports)} ports found open, {65535 - len(self.open_ports)} ports filtered")
-        print("\nHint: The ports you choose may affect your success. Choose wisely!")
+            write(SCAN_LINE_FRAMES[port])
+        write(SCAN_FOOTER_FRAME if len(self.open_ports) == 8 else render_scan_footer(len(self.open_ports)))
+        if self.listeners is not None:
+            await self.open_listeners()
         return True
+
+    async def open_listeners(self):
+        """Bind the real services on the first scan and list where each one is reachable"""
+        try:
+            await self.listeners.open(self)
+        except OSError as error:
+            self.debug_print(f"Listeners unavailable: {error}")
+            self.println("\n[!] Live services are unavailable right now. Use 'connect <port>' instead.")
+            return
+        self.println("\nLive services for this session (port -> reachable on this host at):")
+        for port in self.open_ports:
+            self.println(f"  {port}/tcp -> {self.listeners.ports[port]}/tcp")
+
+    def service_connection(self, port):
+        """Record a fragment request made to one of the live services (--listeners).
+
+        Reaching the port with a real tool counts as scanning it. Returns the part
+        number served on the port and its encoded fragment, or (0, None) once all
+        parts are out."""
+        bit = 1 << PORT_INDEX[port]
+        self.scanned_mask |= bit
+        self.attempted_mask |= bit
+        if port in self.connected:
+            part_number = self.connected.index(port) + 1
+            self.log_event(eventlog.CONNECT, port, eventlog.ALREADY_CONNECTED)
+        else:
+            self.connected.append(port)
+            part_number = len(self.connected)
+            self.log_event(eventlog.CONNECT, port, eventlog.CONNECTED,
+                           part_number if part_number <= PART_COUNT else 0)
+            if part_number <= PART_COUNT:
+                self.println(f"\n[+] Port {port} served encoded part {part_number} of 4 over TCP")
+                if part_number >= 4:
+                    self.game_completed = True
+                    self.show_complete_flag()
+                self.stream.flush_nowait()
+                if self.game_completed:
+                    # The session is waiting for a command it no longer needs
+                    self.stream.wake()
+        if part_number > PART_COUNT:
+            return 0, None
+        return part_number, self.generate_flag_parts()[part_number - 1]
     
-    def connect_to_port(self, port_str):
+    async def connect_to_port(self, port_str):
         """Attempt to connect to a specific port"""
         try:
             port = int(port_str)
         except ValueError:
-            print("Invalid port number. Please enter a valid number.")
+            self.println("Invalid port number. Please enter a valid number.")
+            self.log_event(eventlog.CONNECT, result=eventlog.INVALID_PORT)
             return False
         
         # Check if port is in valid range
         if port < 1 or port > 65535:
-            print(f"\nPort {port} is invalid. Valid ports range from 1-65535. Use the 'scan' command to identify available ports.")
+            self.println(f"\nPort {port} is invalid. Valid ports range from 1-65535. Use the 'scan' command to identify available ports.")
+            self.log_event(eventlog.CONNECT, result=eventlog.INVALID_PORT)
             return False
         
         # Track attempted ports
-        self.attempted_ports.add(port)
+        slot = PORT_INDEX.get(port)
+        bit = 0 if slot is None else 1 << slot
+        if bit:
+            self.attempted_mask |= bit
+        elif self.attempted_other is None:
+            self.attempted_other = array("H", (port,))
+        elif port not in self.attempted_other:
+            self.attempted_other.append(port)
         
         # Check if already connected to this port
-        if port in self.connected_ports:
-            print(f"[!] Already connected to port {port}. Try a different port.")
+        if bit and port in self.connected:
+            self.println(f"[!] Already connected to port {port}. Try a different port.")
+            self.log_event(eventlog.CONNECT, port, eventlog.ALREADY_CONNECTED)
             return False
         
         # Check if port exists and has been scanned
-        if port in self.open_ports:
-            if port not in self.scanned_ports:
-                print(f"\nPort {port} is closed or hasn't been scanned yet. Use the 'scan' command to identify open ports.")
+        if self.open_mask & bit:
+            if not self.scanned_mask & bit:
+                self.println(f"\nPort {port} is closed or hasn't been scanned yet. Use the 'scan' command to identify open ports.")
+                self.log_event(eventlog.CONNECT, port, eventlog.NOT_SCANNED)
                 return False
             
             # Connect to the port and assign a flag part if needed
-            self.connected_ports.append(port)
+            self.connected.append(port)
             
             # Assign a flag part if there are still parts left to assign
-            part_number = len(self.flag_parts) + 1
-            if part_number <= len(self.encoded_parts):
-                encoded_part = self.encoded_parts[part_number-1]
-                self.flag_parts[port] = encoded_part
-                
+            part_number = len(self.connected)
+            has_part = part_number <= PART_COUNT
+            self.log_event(eventlog.CONNECT, port, eventlog.CONNECTED,
+                           part_number if has_part else 0)
+            if has_part:
                 # Milestone messages for first and last parts
                 if part_number == 1:
-                    print("\nMilestone: You found the first encoded part!")
+                    self.stream.write(MILESTONE_FIRST_FRAME)
                 elif part_number == 4:
-                    print("\nMilestone: You found all encoded parts!")
-            
-            # Get port information
-            port_info = self.port_info.get(port, {"name": "Unknown", "description": "Unknown service"})
-            
-            print(f"\n[+] Connection established to {port}/tcp...")
-            print(f"[+] Service banner: {port_info['name']} {port_info['description']}")
+                    self.stream.write(MILESTONE_ALL_FRAME)
             
-            # Add some themed output based on the service type
-            if port_info['name'] == "HTTP" or port_info['name'] == "HTTPS":
-                print("[+] HTTP response: 200 OK")
-                print("[+] Server: Apache/2.4.41")
-                print("[+] Content-Type: text/html")
-                print("[+] Discovered hidden directory")
-            elif port_info['name'] == "FTP":
-                print("[+] FTP response: 220 ProFTPD Server ready.")
-                print("[+] Anonymous login successful")
-                print("[+] Found file: flag_fragment.txt")
-            elif port_info['name'] == "SSH":
-                print("[+] SSH-2.0-OpenSSH_8.2p1")
-                print("[+] Found message in SSH banner")
-            else:
-                print(f"[+] Connected to service: {port_info['description']}")
-                print("[+] Found hidden data in service response")
-            print(" scan in progress ...")
-            time.sleep(3)
+            self.stream.write(CONNECT_BANNER_FRAMES[port])
+            await self.stream.drain()
+            await self.clock.sleep(CONNECT_DELAY)
             # Display the encoded flag part
-            if port in self.flag_parts:
-                print(f"[+] Encoded part {part_number} of 4 found: {self.flag_parts[port]}")
-                if part_number != 4:
-                    print(f"[+] You need to connect to another port for the next part.")
+            if has_part:
+                self.stream.write(FRAGMENT_PREFIX_FRAMES[part_number - 1])
+                self.stream.write(self.generate_flag_parts()[part_number - 1])
+                self.stream.write(FRAGMENT_SUFFIX_FRAMES[part_number - 1])
             
             # Check if we've connected to 4 ports (enough to get the full flag)
-            if len(self.flag_parts) >= 4:
+            if part_number >= 4:
                 self.game_completed = True
                 self.show_complete_flag()
             
             return True
         else:
-            print(f"\nPort {port} is closed or hasn't been scanned yet. Use the 'scan' command to identify open ports.")
+            self.println(f"\nPort {port} is closed or hasn't been scanned yet. Use the 'scan' command to identify open ports.")
+            self.log_event(eventlog.CONNECT, port, eventlog.CLOSED)
             return False
     
     def show_complete_flag(self):
         """Show the complete flag once 4 ports are connected"""
-        print("\n🎯 Target successfully compromised! 🎯")
+        self.stream.write(COMPLETE_FRAME)
     
         
         # Print just all the fragments together:
@@ -237,17 +544,8 @@ class PortScanningChallenge:
         #print("\n```")
         #print("\033[93m--------------------------------\033[0m")    
 
-        print("\n\033[93mAnalyze the full string to reconstruct the final flag!\033[0m")
         #print("\033[92mHint 1: Each fragment is base64 encoded. The final puzzle might involve further decoding, perhaps multiple times. Once fully decoded, you may discover an image revealing the final secret.\033[0m")
 
-
-        print("\n\033[93mExample Approach:\033[0m")
-        print("\033[92mYou might try writing a simple Python script that:\033[0m")
-        print("          1) Takes the collected encoded flag fragments.")
-        print("          2) Decodes each fragment (can you identify the encoding?).")
-        print("          3) Assembles the decoded parts in the correct order.")
-        print("          4) Maybe save the file with a specific extension?")
-
         # print("\n\033[93mTerminal Command Hint:\033[0m")
         # print("\033[92mOn a Linux/macOS terminal, you could try running:\033[0m")
         # print("          $ echo -n '<encoded-data>' | base64 -d")
@@ -257,49 +555,110 @@ class PortScanningChallenge:
     
     def print_status(self):
         """Print current game status"""
-        print("\n=== MISSION STATUS ===")
-        print(f"Ports discovered: {len(self.scanned_ports)}/{len(self.open_ports)}")
-        print(f"Ports connected: {len(self.connected_ports)}/4 (need 4 to complete)")
+        self.println("\n=== MISSION STATUS ===")
+        self.println(f"Ports discovered: {popcount(self.scanned_mask)}/{len(self.open_ports)}")
+        self.println(f"Ports connected: {len(self.connected)}/4 (need 4 to complete)")
         
         # Show debug information if enabled
         if self.debug_mode:
-            print(f"DEBUG: Open ports: {', '.join(map(str, self.open_ports))}")
-            invalid_attempts = self.attempted_ports - set(self.open_ports)
+            self.println(f"DEBUG: Open ports: {', '.join(map(str, self.open_ports))}")
+            invalid_attempts = self.invalid_attempts()
             if invalid_attempts:
-                print(f"DEBUG: Invalid port attempts: {', '.join(map(str, invalid_attempts))}")
+                self.println(f"DEBUG: Invalid port attempts: {', '.join(map(str, invalid_attempts))}")
         
-        if self.connected_ports:
-            print(f"Connected to ports: {', '.join(map(str, self.connected_ports))}")
-            print(f"Flag fragments collected: {len(self.flag_parts)}/4")
+        if self.connected:
+            self.println(f"Connected to ports: {', '.join(map(str, self.connected))}")
+            self.println(f"Flag fragments collected: {min(len(self.connected), PART_COUNT)}/4")
         
         if self.game_completed:
-            print("\n[+] Challenge complete! All flag fragments collected.")
+            self.println("\n[+] Challenge complete! All flag fragments collected.")
             self.exit_challenge()
     
-    def run(self):
-        """Main game loop"""
+    async def command_exit(self, argument):
+        self.log_event(eventlog.EXIT)
+        self.println("Exiting challenge. Goodbye!")
+        return True
+
+    async def command_help(self, argument):
+        self.log_event(eventlog.HELP)
         self.print_welcome()
-        
-        while not self.game_completed:
-            command = input("\nEnter command: ").strip().lower()
+
+    async def command_scan(self, argument):
+        self.log_event(eventlog.SCAN)
+        await self.scan_ports()
+
+    async def command_status(self, argument):
+        self.log_event(eventlog.STATUS)
+        self.print_status()
+
+    async def command_connect(self, argument):
+        await self.connect_to_port(argument)
+
+    async def command_invalid(self, argument):
+        self.log_event(eventlog.INVALID)
+        self.println("Invalid command. Use 'scan', 'connect <port>', 'status', or 'exit'.")
+
+    # Command word -> (handler, whether it takes an argument)
+    commands = MappingProxyType({
+        "exit": (command_exit, False),
+        "help": (command_help, False),
+        "scan": (command_scan, False),
+        "status": (command_status, False),
+        "connect": (command_connect, True),
+    })
+
+    async def execute(self, line):
+        """Run one input line; returns True when the session should end"""
+        command = line.strip().lower()
+        name, separator, argument = command.partition(" ")
+        handler, takes_argument = self.commands.get(name, (None, False))
+        if handler is None or bool(separator) != takes_argument:
+            handler = PortScanningChallenge.command_invalid
+        return await handler(self, argument)
+
+    async def run(self, on_command=None):
+        """Main game loop.
+
+        on_command, if given, is called with each input line after it has run
+        (used by --script to report one result per command)."""
+        self.log_event(eventlog.START)
+        session_started = time.perf_counter()
+        end_result = eventlog.DISCONNECTED
+        try:
+            self.print_welcome()
             
-            if command == "exit":
-                print("Exiting challenge. Goodbye!")
-                sys.exit(0)
-            elif command == "help":
-                self.print_welcome()
-            elif command == "scan":
-                self.scan_ports()
-            elif command == "status":
-                self.print_status()
-            elif command.startswith("connect "):
-                parts = command.split(" ", 1)
-                if len(parts) == 2:
-                    self.connect_to_port(parts[1])
-                else:
-                    print("Invalid command. Use 'connect <port>'.")
-            else:
-                print("Invalid command. Use 'scan', 'connect <port>', 'status', or 'exit'.")
+            while not self.game_completed:
+                self.stream.write(PROMPT_FRAME)
+                await self.stream.drain()
+                line = await self.stream.readline()
+                if not line:
+                    # Client hung up (EOF on stdin or closed socket)
+                    break
+                if self.game_completed:
+                    # Completed through the live services while waiting for input
+                    break
+                command_started = time.perf_counter()
+                stop = await self.execute(line)
+                server_metrics.command_latency[self.last_event[0]].observe(time.perf_counter() - command_started)
+                if on_command is not None:
+                    on_command(line)
+                if stop:
+                    end_result = eventlog.EXITED
+                    break
+            await self.stream.drain()
+        except server.SessionExpired as expired:
+            # Reaped: the participant still gets the summary, and the log records why it ended
+            end_result = eventlog.REAPED
+            if not self.game_completed:
+                self.println(f"\n\n[!] {expired}. Closing the session.")
+                self.exit_challenge()
+            await self.stream.drain()
+        finally:
+            if self.game_completed:
+                end_result = eventlog.COMPLETED
+            self.log_event(eventlog.END, result=end_result, fragment=min(len(self.connected), PART_COUNT))
+            server_metrics.session_duration.observe(time.perf_counter() - session_started)
+
     def write_flag_file(self):
         """Write the flag to a file"""
         fragments_file = "fragments.txt"
@@ -315,15 +674,17 @@ class PortScanningChallenge:
         """Write the Qualtrics output to a file instead of printing it.
            If the file already exists, print a message and do not overwrite it."""
         self.write_flag_file()
-        print("\n\033[95m--- *** QUALTRICS INFORMATION START *** ---\033[0m")
-        print("\033[95mPlease copy/paste this information into a .txt file and upload to Qualtrics to receive compensation for this challenge.\033[0m")
+        self.stream.write(QUALTRICS_START_FRAME)
         output_text = (
             f"Condition: {1 if self.treatment_mode else 0}\n"
-            f"Ports connected: {', '.join(map(str, self.connected_ports))}\n"
-            f"Total unique ports connected: {len(self.connected_ports)}"
+            f"Ports connected: {', '.join(map(str, self.connected))}\n"
+            f"Total unique ports connected: {len(self.connected)}"
         )
-        print(output_text)
-        print("\033[95m--- *** QUALTRICS INFORMATION END *** ---\033[0m")
+        if self.per_session_flag:
+            # Lets the grader match the participant's flag to this session
+            output_text += f"\nSession: {self.session_id:016x}"
+        self.println(output_text)
+        self.stream.write(QUALTRICS_END_FRAME)
         """
         output_file = "ports_challenge.txt"
         
@@ -335,12 +696,129 @@ class PortScanningChallenge:
                 print(f"Output file '{os.path.abspath(output_file)}' has been created. Please upload this file to Qualtrics to get compensation for this challenge.")
         """
 
+def session_factory(instant=False, **game_options):
+    """The new_session(stream, events, listeners) callable the servers start games with"""
+    def new_session(stream, events=None, listeners=None):
+        clock = VirtualClock() if instant else RealClock()
+        return PortScanningChallenge(stream=stream, clock=clock, events=events, listeners=listeners,
+                                     **game_options)
+    return new_session
+
+async def run_script(paths, out=sys.stdout, paced=False, seed=None, events=None, **session_options):
+    """Batch mode: run each transcript as its own session in one pass.
+
+    Writes one JSON line per command (with its event, result and output) and a
+    summary line per transcript. Pacing is skipped unless paced is set."""
+    for path in paths:
+        if path == "-":
+            lines = sys.stdin.readlines()
+        else:
+            with open(path) as f:
+                lines = f.readlines()
+        if seed is not None:
+            random.seed(seed)
+        stream = server.ScriptStream(lines)
+        clock = RealClock() if paced else VirtualClock()
+        game = PortScanningChallenge(stream=stream, clock=clock, events=events, **session_options)
+
+        def report(line):
+            event, port, result, fragment = game.last_event
+            out.write(json.dumps({
+                "transcript": path,
+                "line": stream.line_number,
+                "command": line.strip(),
+                "event": eventlog.EVENT_NAMES[event],
+                "port": port or None,
+                "result": eventlog.result_name(event, result),
+                "fragment": fragment or None,
+                "output": ANSI_ESCAPE.sub("", stream.take_output()),
+            }) + "\n")
+
+        await game.run(on_command=report)
+        event, _, result, fragment = game.last_event
+        out.write(json.dumps({
+            "transcript": path,
+            "session": f"{game.session_id:016x}",
+            "condition": 1 if game.treatment_mode else 0,
+            "end": eventlog.result_name(event, result),
+            "fragments": fragment,
+            "connected": list(game.connected),
+            "commands": stream.line_number,
+            "unprocessed": len(lines) - stream.line_number,
+        }) + "\n")
+    out.flush()
+
 def parse_arguments():
     parser = argparse.ArgumentParser(description='Port scanning CTF challenge')
     parser.add_argument('--treatment', action='store_true', 
                         help='Run in treatment condition (well-known ports)')
     parser.add_argument('--debug', action='store_true', 
                         help='Display debug information')
+    parser.add_argument('--serve', type=int, metavar='PORT',
+                        help='Serve many sessions over TCP from this process instead of using stdin/stdout')
+    parser.add_argument('--host', default='0.0.0.0',
+                        help='Address to bind when using --serve (default: 0.0.0.0)')
+    parser.add_argument('--prefork', type=int, metavar='N',
+                        help='With --serve, run each player in one of N pre-forked worker processes')
+    parser.add_argument('--worker-sessions', type=int, default=server.WORKER_SESSIONS, metavar='N',
+                        help=f'With --prefork, sessions each worker serves before it is replaced (default: {server.WORKER_SESSIONS})')
+    parser.add_argument('--instant', action='store_true',
+                        help='Skip the simulated scan/connect delays (for tests and replays)')
+    parser.add_argument('--output-timeout', type=float, default=server.OUTPUT_TIMEOUT, metavar='SECONDS',
+                        help='Drop a client whose unread output stays above the write limit this long')
+    parser.add_argument('--write-buffer-limit', type=int, default=server.WRITE_HIGH_WATER, metavar='BYTES',
+                        help='Per-session socket buffer high-water mark (low-water is a quarter of it)')
+    parser.add_argument('--event-log', metavar='DIR',
+                        help='Append a structured record of every session command to files in DIR')
+    parser.add_argument('--event-format', choices=sorted(eventlog.FORMATS), default='binary',
+                        help='Event log format: fixed-size binary records or JSON lines (default: binary)')
+    parser.add_argument('--event-rotate-mb', type=float, default=eventlog.ROTATE_BYTES / (1024 * 1024), metavar='MB',
+                        help='Start a new event log file after this many megabytes (default: 4)')
+    parser.add_argument('--event-retain-mb', type=float, default=0, metavar='MB',
+                        help="Delete this process's oldest event log files beyond this many megabytes "
+                             '(default: 0 = keep everything)')
+    parser.add_argument('--event-fsync', choices=eventlog.FSYNC_POLICIES, default='rotate',
+                        help='fsync event log files never, on rotation/close, or after every batch')
+    parser.add_argument('--flag-file', nargs='?', const=FLAG_METADATA_PATH, metavar='PATH',
+                        help='Serve an image of the flag in this metadata file instead of the static '
+                             f'payload (default: {FLAG_METADATA_PATH})')
+    parser.add_argument('--per-session-flags', action='store_true',
+                        help='With --flag-file, tag the flag with each session id so every player gets a unique flag')
+    parser.add_argument('--payload-cache-mb', type=float, default=PAYLOAD_CACHE_BYTES / (1024 * 1024), metavar='MB',
+                        help='Memory bound for cached templated payloads (default: 32)')
+    parser.add_argument('--listeners', type=listeners.parse_port_range, metavar='START-END',
+                        help="With --serve, bind each session's open ports as real services on host ports "
+                             'from this range once the session scans')
+    parser.add_argument('--listener-host', metavar='ADDRESS',
+                        help='Address the live services bind to (default: --host)')
+    parser.add_argument('--idle-timeout', type=float, default=server.IDLE_TIMEOUT, metavar='SECONDS',
+                        help=f'With --serve, end a session after this long without input (default: {server.IDLE_TIMEOUT}, 0 = never)')
+    parser.add_argument('--session-lifetime', type=float, default=server.SESSION_LIFETIME, metavar='SECONDS',
+                        help=f'With --serve, end a session this long after it starts (default: {server.SESSION_LIFETIME}, 0 = never)')
+    parser.add_argument('--max-sessions', type=int, metavar='N',
+                        help='With --serve, run at most N sessions at once; later clients wait in the accept queue '
+                             '(default: as many as fit the open-file limit)')
+    parser.add_argument('--accept-queue', type=int, default=server.ACCEPT_QUEUE_SIZE, metavar='N',
+                        help=f'Clients that may wait for a session slot; the rest are told to retry (default: {server.ACCEPT_QUEUE_SIZE})')
+    parser.add_argument('--accept-timeout', type=float, default=server.ACCEPT_QUEUE_TIMEOUT, metavar='SECONDS',
+                        help=f'Longest wait in the accept queue before being told to retry (default: {server.ACCEPT_QUEUE_TIMEOUT})')
+    parser.add_argument('--max-per-address', type=int, metavar='N',
+                        help='With --serve, allow at most N connections (running or queued) per client address')
+    parser.add_argument('--retry-after', type=int, default=server.RETRY_AFTER, metavar='SECONDS',
+                        help=f'Retry delay suggested to refused clients (default: {server.RETRY_AFTER})')
+    parser.add_argument('--metrics-port', type=int, metavar='PORT',
+                        help='With --serve, expose metrics in Prometheus text format on 127.0.0.1:PORT')
+    parser.add_argument('--metrics-file', metavar='PATH',
+                        help='With --serve, periodically replace PATH with a JSON snapshot of the metrics')
+    parser.add_argument('--metrics-interval', type=float, default=metrics.SNAPSHOT_INTERVAL, metavar='SECONDS',
+                        help=f'Seconds between metrics snapshots (default: {metrics.SNAPSHOT_INTERVAL})')
+    parser.add_argument('--script', nargs='+', metavar='FILE',
+                        help='Batch mode: run each command transcript ("-" for stdin) as a session and '
+                             'print one JSON result per command')
+    parser.add_argument('--paced', action='store_true',
+                        help='With --script, keep the simulated scan/connect delays')
+    parser.add_argument('--seed', type=int,
+                        help='With --script, seed the port shuffle before each transcript for reproducible output')
     return parser.parse_args()
 
 def main():
@@ -354,8 +832,69 @@ def main():
     if args_d:
         debug_mode = args_d
     
-    game = PortScanningChallenge(treatment_mode=treatment_mode, debug_mode=debug_mode)
-    game.run()
+    game_options = dict(treatment_mode=treatment_mode, debug_mode=debug_mode)
+    if args.flag_file:
+        game_options.update(flag=read_flag(args.flag_file), per_session_flag=args.per_session_flags)
+    payload_cache.max_bytes = int(args.payload_cache_mb * 1024 * 1024)
+    session_options = dict(new_session=session_factory(instant=args.instant, **game_options),
+                           server_metrics=server_metrics, output_timeout=args.output_timeout,
+                           write_high_water=args.write_buffer_limit, idle_timeout=args.idle_timeout or None,
+                           session_lifetime=args.session_lifetime or None)
+    if (args.metrics_port or args.metrics_file) and (not args.serve or args.prefork):
+        sys.exit("--metrics-port and --metrics-file need --serve without --prefork "
+                 "(metrics are kept per process)")
+    serve_options = {}
+    if (args.max_sessions or args.max_per_address) and (not args.serve or args.prefork):
+        sys.exit("--max-sessions and --max-per-address need --serve without --prefork "
+                 "(the pool size bounds --prefork)")
+    if args.serve and not args.prefork:
+        max_sessions, queue_size = server.session_budget(args.accept_queue, with_listeners=bool(args.listeners))
+        if args.max_sessions:
+            if max_sessions is not None and args.max_sessions > max_sessions:
+                print(f"Warning: --max-sessions {args.max_sessions} may exceed the open-file limit "
+                      f"(about {max_sessions} sessions fit); raise the nofile ulimit", file=sys.stderr)
+            max_sessions, queue_size = args.max_sessions, args.accept_queue
+        session_options.update(session_manager=server.SessionManager(
+            max_sessions=max_sessions, queue_size=queue_size, queue_timeout=args.accept_timeout,
+            max_per_address=args.max_per_address, retry_after=args.retry_after))
+        if max_sessions is not None:
+            serve_options.update(max_connections=max_sessions + queue_size + server.REFUSAL_DESCRIPTORS)
+    if args.listeners:
+        if not args.serve or args.prefork:
+            sys.exit("--listeners needs --serve without --prefork (the port pool is shared in one process)")
+        session_options.update(port_allocator=listeners.PortAllocator(*args.listeners),
+                               listener_host=args.listener_host or args.host)
+    event_log_options = None
+    if args.event_log:
+        event_log_options = dict(directory=args.event_log, fmt=args.event_format,
+                                 rotate_bytes=int(args.event_rotate_mb * 1024 * 1024), fsync=args.event_fsync,
+                                 retain_bytes=int(args.event_retain_mb * 1024 * 1024) or None)
+    if args.serve and args.prefork:
+        # Map the payload once in the parent so every worker shares its pages
+        load_payload_parts()
+        flag = game_options.get("flag")
+        if flag is not None and not game_options.get("per_session_flag"):
+            # Every worker serves the same templated payload, so render it before forking
+            payload_cache.get(flag)
+        server.prefork(args.serve, host=args.host, workers=args.prefork, event_log_options=event_log_options,
+                       sessions_per_worker=args.worker_sessions, **session_options)
+        return
+
+    events = server.open_event_log(event_log_options)
+    try:
+        if args.script:
+            asyncio.run(run_script(args.script, paced=args.paced, seed=args.seed, events=events, **game_options))
+        elif args.serve:
+            asyncio.run(server.serve(args.serve, host=args.host, events=events, metrics_port=args.metrics_port,
+                                     metrics_file=args.metrics_file, metrics_interval=args.metrics_interval,
+                                     **serve_options, **session_options))
+        else:
+            clock = VirtualClock() if args.instant else RealClock()
+            game = PortScanningChallenge(clock=clock, events=events, **game_options)
+            asyncio.run(game.run())
+    finally:
+        if events is not None:
+            events.close()
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
@@ -0,0 +1,229 @@
+#!/usr/bin/env python3
+"""In-process metrics for the challenge server.
+
+Counters and histograms are preallocated lists indexed by the event log's
+event and result codes and by port slot, and are updated from the same calls
+that write the event log. Recording a command is therefore a few list-index
+increments on the event loop thread: no locks, no dictionaries, no new objects
+beyond the integers themselves.
+
+The values can be pulled in Prometheus text format from a loopback HTTP port
+(--metrics-port) and written periodically to a JSON snapshot file
+(--metrics-file).
+"""
+import asyncio
+import json
+import os
+import sys
+import time
+from bisect import bisect_left
+
+import eventlog
+
+
+CONDITIONS = ("control", "treatment")
+# Upper bounds in seconds. Command latency includes the simulated delays
+# (about 0.9 s for scan, 3 s for connect).
+LATENCY_BUCKETS = (0.0005, 0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1, 2.5, 5, 10)
+SESSION_BUCKETS = (10, 30, 60, 120, 300, 600, 1200, 1800, 3600, 7200)
+COMMAND_EVENTS = (eventlog.SCAN, eventlog.CONNECT, eventlog.STATUS, eventlog.HELP, eventlog.INVALID, eventlog.EXIT)
+SNAPSHOT_INTERVAL = 10
+# Seconds a metrics client has to send its request headers
+REQUEST_TIMEOUT = 5
+
+
+class Histogram:
+    """Fixed-bucket histogram; bucket i counts values up to bounds[i], the last one the rest"""
+    __slots__ = ("bounds", "buckets", "total", "count")
+
+    def __init__(self, bounds):
+        self.bounds = bounds
+        self.buckets = [0] * (len(bounds) + 1)
+        self.total = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        self.buckets[bisect_left(self.bounds, value)] += 1
+        self.total += value
+        self.count += 1
+
+    def cumulative(self):
+        """(upper bound, count of values up to it) pairs, ending with +Inf"""
+        running = 0
+        pairs = []
+        for bound, count in zip(self.bounds + (float("inf"),), self.buckets):
+            running += count
+            pairs.append((bound, running))
+        return pairs
+
+
+class Metrics:
+    """Process-wide counters for every session served by this process"""
+
+    def __init__(self, ports):
+        self.ports = tuple(ports)
+        self.port_index = {port: slot for slot, port in enumerate(self.ports)}
+        self.started = time.time()
+        self.sessions_active = 0
+        self.sessions_started = 0
+        self.sessions_ended = [0] * len(eventlog.END_RESULTS)
+        self.session_duration = Histogram(SESSION_BUCKETS)
+        # Indexed by event code; START and END are counted but not reported as commands
+        self.commands = [0] * len(eventlog.EVENT_NAMES)
+        self.command_latency = [Histogram(LATENCY_BUCKETS) for _ in eventlog.EVENT_NAMES]
+        self.bytes_written = 0
+        # Indexed by condition, then by connect result or port slot
+        self.connect_results = [[0] * len(eventlog.CONNECT_RESULTS) for _ in CONDITIONS]
+        self.fragments = [[0] * len(self.ports) for _ in CONDITIONS]
+        # Connects to ports that are not open in the session, or are not ports at all
+        self.invalid_ports = [0] * len(CONDITIONS)
+
+    def record_event(self, event, condition, port=0, result=0, fragment=0):
+        """Count one session event (called with the same values as the event log)"""
+        self.commands[event] += 1
+        if event == eventlog.CONNECT:
+            self.connect_results[condition][result] += 1
+            if fragment:
+                self.fragments[condition][self.port_index[port]] += 1
+            elif result == eventlog.CLOSED or result == eventlog.INVALID_PORT:
+                self.invalid_ports[condition] += 1
+        elif event == eventlog.START:
+            self.sessions_active += 1
+            self.sessions_started += 1
+        elif event == eventlog.END:
+            self.sessions_active -= 1
+            self.sessions_ended[result] += 1
+
+    def render_prometheus(self):
+        """All metrics in the Prometheus text exposition format"""
+        lines = []
+
+        def metric(name, kind, help_text, samples):
+            lines.append(f"# HELP portscan_{name} {help_text}")
+            lines.append(f"# TYPE portscan_{name} {kind}")
+            for labels, value in samples:
+                label_text = ",".join(f'{key}="{label}"' for key, label in labels)
+                lines.append(f"portscan_{name}{{{label_text}}} {value}" if label_text
+                             else f"portscan_{name} {value}")
+
+        def histogram(name, help_text, entries):
+            lines.append(f"# HELP portscan_{name} {help_text}")
+            lines.append(f"# TYPE portscan_{name} histogram")
+            for labels, hist in entries:
+                prefix = "".join(f'{key}="{label}",' for key, label in labels)
+                for bound, count in hist.cumulative():
+                    le = "+Inf" if bound == float("inf") else f"{bound:g}"
+                    lines.append(f'portscan_{name}_bucket{{{prefix}le="{le}"}} {count}')
+                suffix = f"{{{prefix.rstrip(',')}}}" if prefix else ""
+                lines.append(f"portscan_{name}_sum{suffix} {hist.total}")
+                lines.append(f"portscan_{name}_count{suffix} {hist.count}")
+
+        metric("sessions_active", "gauge", "Sessions currently running", [((), self.sessions_active)])
+        metric("sessions_started_total", "counter", "Sessions started", [((), self.sessions_started)])
+        metric("sessions_ended_total", "counter", "Sessions ended, by how they ended",
+               [((("result", name),), self.sessions_ended[code])
+                for code, name in enumerate(eventlog.END_RESULTS) if name])
+        histogram("session_duration_seconds", "Session duration", [((), self.session_duration)])
+        metric("commands_total", "counter", "Commands run, by type",
+               [((("command", eventlog.EVENT_NAMES[event]),), self.commands[event]) for event in COMMAND_EVENTS])
+        histogram("command_duration_seconds", "Time to run a command, including simulated delays",
+                  [((("command", eventlog.EVENT_NAMES[event]),), self.command_latency[event])
+                   for event in COMMAND_EVENTS])
+        metric("bytes_written_total", "counter", "Bytes of session output written", [((), self.bytes_written)])
+        metric("connect_attempts_total", "counter", "Connect commands, by condition and result",
+               [((("condition", condition), ("result", name)), self.connect_results[code][result])
+                for code, condition in enumerate(CONDITIONS)
+                for result, name in enumerate(eventlog.CONNECT_RESULTS) if name])
+        metric("fragments_served_total", "counter", "Flag fragments served, by port and condition",
+               [((("port", port), ("condition", condition)), self.fragments[code][slot])
+                for code, condition in enumerate(CONDITIONS) for slot, port in enumerate(self.ports)])
+        metric("invalid_port_attempts_total", "counter", "Connects to closed or invalid ports, by condition",
+               [((("condition", condition),), self.invalid_ports[code]) for code, condition in enumerate(CONDITIONS)])
+        return "\n".join(lines) + "\n"
+
+    def snapshot(self):
+        """All metrics as a JSON-serializable dict"""
+        def histogram(hist):
+            return {"buckets": [["+Inf" if bound == float("inf") else bound, count]
+                                for bound, count in hist.cumulative()],
+                    "sum": hist.total, "count": hist.count}
+
+        return {
+            "time": time.time(),
+            "uptime_s": time.time() - self.started,
+            "sessions": {
+                "active": self.sessions_active,
+                "started": self.sessions_started,
+                "ended": {name: self.sessions_ended[code] for code, name in enumerate(eventlog.END_RESULTS) if name},
+                "duration_s": histogram(self.session_duration),
+            },
+            "commands": {eventlog.EVENT_NAMES[event]: self.commands[event] for event in COMMAND_EVENTS},
+            "command_duration_s": {eventlog.EVENT_NAMES[event]: histogram(self.command_latency[event])
+                                   for event in COMMAND_EVENTS},
+            "bytes_written": self.bytes_written,
+            "connect_attempts": {condition: {name: self.connect_results[code][result]
+                                             for result, name in enumerate(eventlog.CONNECT_RESULTS) if name}
+                                 for code, condition in enumerate(CONDITIONS)},
+            "fragments_served": {condition: {str(port): self.fragments[code][slot]
+                                             for slot, port in enumerate(self.ports)}
+                                 for code, condition in enumerate(CONDITIONS)},
+            "invalid_port_attempts": {condition: self.invalid_ports[code]
+                                      for code, condition in enumerate(CONDITIONS)},
+        }
+
+
+async def read_headers(reader):
+    while (await reader.readline()).strip():
+        pass
+
+async def serve_metrics(metrics, port, host="127.0.0.1"):
+    """Answer every HTTP request on host:port with the Prometheus text (keep it on loopback)"""
+    async def handle(reader, writer):
+        try:
+            # Read up to the end of the request headers; the path is ignored
+            await asyncio.wait_for(read_headers(reader), REQUEST_TIMEOUT)
+            body = metrics.render_prometheus().encode()
+            writer.write(b"HTTP/1.0 200 OK\r\nContent-Type: text/plain; version=0.0.4\r\n"
+                         + f"Content-Length: {len(body)}\r\n\r\n".encode() + body)
+            await writer.drain()
+        except (ConnectionError, ValueError, asyncio.TimeoutError):
+            pass
+        finally:
+            writer.close()
+
+    return await asyncio.start_server(handle, host, port)
+
+def write_snapshot(snapshot, path):
+    """Atomically replace path with the JSON snapshot"""
+    temporary = f"{path}.tmp"
+    with open(temporary, "w") as f:
+        json.dump(snapshot, f, indent=2)
+    os.replace(temporary, path)
+
+async def write_snapshots(metrics, path, interval=SNAPSHOT_INTERVAL):
+    """Replace path with a JSON snapshot every interval seconds, adding per-second command rates.
+
+    Files are written from the default executor so a slow disk never stalls sessions.
+    A failed write is reported once until a write succeeds again, and never stops the loop."""
+    loop = asyncio.get_running_loop()
+    previous = None
+    failing = False
+    while True:
+        snapshot = metrics.snapshot()
+        if previous is not None:
+            elapsed = snapshot["time"] - previous["time"]
+            snapshot["commands_per_second"] = {
+                name: (count - previous["commands"][name]) / elapsed
+                for name, count in snapshot["commands"].items()}
+        try:
+            await loop.run_in_executor(None, write_snapshot, snapshot, path)
+        except OSError as error:
+            if not failing:
+                print(f"Cannot write the metrics snapshot: {error}", file=sys.stderr)
+            failing = True
+        else:
+            if failing:
+                print(f"Metrics snapshot written to {path} again", file=sys.stderr)
+            failing = False
+        previous = snapshot
+        await asyncio.sleep(interval)
@@ -0,0 +1,546 @@
+#!/usr/bin/env python3
+"""Session I/O and serving for the challenge (--serve, --prefork, --script).
+
+The game itself (PortScanningChallenge in main.py) only writes to and reads
+from a stream: the terminal, a TCP connection or a --script transcript. This
+module provides those streams and everything around a TCP session: admission
+control (SessionManager), the descriptor budget its defaults are sized from,
+the accept loop of the single-process server and the pre-forked worker pool.
+Servers start games through a new_session(stream, events, listeners) callable,
+so this module does not depend on the game.
+"""
+import asyncio
+import errno
+import os
+import random
+import resource
+import signal
+import socket
+import sys
+import time
+import traceback
+from collections import deque
+
+import eventlog
+import listeners
+import metrics
+
+
+# Socket output: responses are streamed in bounded chunks, and a client that keeps
+# more than the high-water mark unread for OUTPUT_TIMEOUT seconds is dropped
+OUTPUT_CHUNK_SIZE = 4096
+WRITE_HIGH_WATER = 16 * 1024
+WRITE_LOW_WATER = 4 * 1024
+OUTPUT_TIMEOUT = 30
+
+# Sessions a --prefork worker serves, one at a time, before it is replaced
+WORKER_SESSIONS = 1000
+# A worker that fails before accepting its first player exits with WORKER_START_FAILED;
+# the next fork then waits RESPAWN_DELAY seconds, doubling up to RESPAWN_DELAY_MAX,
+# and the pool stops after MAX_FAILED_STARTS such failures in a row
+WORKER_START_FAILED = 2
+RESPAWN_DELAY = 0.5
+RESPAWN_DELAY_MAX = 10
+MAX_FAILED_STARTS = 5
+
+# Session limits for --serve: abandoned sessions are reaped after IDLE_TIMEOUT seconds
+# without input or SESSION_LIFETIME seconds in total, and a client refused by the
+# session manager is told to come back after RETRY_AFTER seconds
+IDLE_TIMEOUT = 900
+SESSION_LIFETIME = 2 * 60 * 60
+ACCEPT_QUEUE_SIZE = 64
+ACCEPT_QUEUE_TIMEOUT = 30
+RETRY_AFTER = 30
+
+# File descriptor budget for --serve. Every running or queued client holds its socket,
+# and with --listeners a session also holds a listening socket per open port. The
+# default limits are sized so that all of them fit under RLIMIT_NOFILE, leaving
+# RESERVED_DESCRIPTORS for the server itself (listening socket, event log, metrics,
+# stub connections) and REFUSAL_DESCRIPTORS for clients being told to retry. Past
+# that, new connections wait in the kernel's backlog instead of failing accept()
+# with EMFILE.
+RESERVED_DESCRIPTORS = 16
+REFUSAL_DESCRIPTORS = 8
+OPEN_PORT_COUNT = 8
+# Seconds accepting pauses after running out of descriptors anyway
+ACCEPT_RETRY_DELAY = 1
+
+# Streams of the sessions currently being served by this process
+active_streams = set()
+
+
+class ConsoleStream:
+    """Session I/O over the process's stdin/stdout (local terminal or socat)"""
+
+    def write(self, data):
+        sys.stdout.buffer.write(data)
+
+    async def drain(self):
+        sys.stdout.buffer.flush()
+
+    def flush_nowait(self):
+        sys.stdout.buffer.flush()
+
+    def wake(self):
+        pass
+
+    async def readline(self):
+        """Read one line of input, returning an empty string on EOF"""
+        return sys.stdin.readline()
+
+    async def close(self):
+        sys.stdout.buffer.flush()
+
+
+class SocketStream:
+    """Session I/O over an asyncio connection (one per client in --serve mode)"""
+
+    def __init__(self, reader, writer, output_timeout=OUTPUT_TIMEOUT,
+                 high_water=WRITE_HIGH_WATER, low_water=WRITE_LOW_WATER, idle_timeout=None, metrics=None):
+        self.reader = reader
+        self.writer = writer
+        self.peer = writer.get_extra_info("peername")
+        self.output_timeout = output_timeout
+        self.idle_timeout = idle_timeout
+        # Monotonic time after which the session is reaped, set once it is admitted
+        self.deadline = None
+        self.high_water = high_water
+        writer.transport.set_write_buffer_limits(high=high_water, low=low_water)
+        # Output is queued until drain() so each response goes out in as few writes as possible
+        self.pending = []
+        self.draining = False
+        # Process-wide metrics.Metrics counting the bytes written, if any
+        self.metrics = metrics
+
+    @property
+    def bytes_queued(self):
+        """Output not yet accepted by the client's socket"""
+        return self.writer.transport.get_write_buffer_size() + sum(len(data) for data in self.pending)
+
+    def write(self, data):
+        self.pending.append(data)
+        if self.metrics is not None:
+            self.metrics.bytes_written += len(data)
+
+    async def drain(self):
+        """Send queued output in chunks of at most OUTPUT_CHUNK_SIZE bytes.
+
+        Large pieces (the fragments) are sliced without copying, and the session waits
+        for the client to catch up whenever its socket buffer passes the high-water mark,
+        so a slow reader holds at most one chunk beyond that mark in memory."""
+        pending, self.pending = self.pending, []
+        batch = []
+        batch_size = 0
+        self.draining = True
+        try:
+            for data in pending:
+                if len(data) <= OUTPUT_CHUNK_SIZE - batch_size:
+                    batch.append(data)
+                    batch_size += len(data)
+                    continue
+                # Too big for the current batch: send that first so no write exceeds a chunk
+                if batch:
+                    await self.send(batch)
+                    batch = []
+                    batch_size = 0
+                view = memoryview(data)
+                for start in range(0, len(view), OUTPUT_CHUNK_SIZE):
+                    chunk = view[start:start + OUTPUT_CHUNK_SIZE]
+                    if len(chunk) == OUTPUT_CHUNK_SIZE:
+                        await self.send([chunk])
+                    else:
+                        batch = [chunk]
+                        batch_size = len(chunk)
+            if batch:
+                await self.send(batch)
+            await self.wait_writable()
+        finally:
+            self.draining = False
+
+    def flush_nowait(self):
+        """Send short queued notices now, from outside the command loop.
+
+        Left queued while a drain is in progress so they never land inside a
+        fragment; the session's next drain sends them."""
+        if not self.draining and not self.writer.is_closing():
+            pending, self.pending = self.pending, []
+            self.writer.writelines(pending)
+
+    def wake(self):
+        """End a pending readline() as if the client had hung up, once the session is over.
+
+        Reading is paused first: the client may still type, and the reader
+        accepts no data after EOF."""
+        if not self.reader.at_eof():
+            self.writer.transport.pause_reading()
+            self.reader.feed_eof()
+
+    async def send(self, batch):
+        if self.writer.is_closing():
+            raise ConnectionResetError("client disconnected")
+        self.writer.writelines(batch)
+        if self.writer.transport.get_write_buffer_size() > self.high_water:
+            await self.wait_writable()
+
+    async def wait_writable(self):
+        """Wait until the socket buffer is back under the low-water mark, for at most output_timeout"""
+        try:
+            await asyncio.wait_for(self.writer.drain(), self.output_timeout)
+        except asyncio.TimeoutError:
+            # Client stopped reading: free the buffer and the descriptor now
+            self.writer.transport.abort()
+            raise ConnectionResetError("client stopped reading")
+
+    async def readline(self):
+        """Read one line of input, returning an empty string on EOF or a line over
+        the stream limit (64 KB), which ends the session like a hang-up.
+
+        Raises SessionExpired when no line arrives within the idle timeout or
+        before the session's deadline."""
+        timeout = self.idle_timeout
+        reason = f"No input for {timeout:g} seconds" if timeout is not None else None
+        if self.deadline is not None:
+            remaining = self.deadline - time.monotonic()
+            if timeout is None or remaining < timeout:
+                timeout = max(remaining, 0)
+                reason = "Session time limit reached"
+        try:
+            if timeout is None:
+                line = await self.reader.readline()
+            else:
+                line = await asyncio.wait_for(self.reader.readline(), timeout)
+        except asyncio.TimeoutError:
+            raise SessionExpired(reason) from None
+        except ValueError:
+            # StreamReader's limit overrun
+            return ""
+        return line.decode(errors="replace")
+
+    async def close(self):
+        self.writer.close()
+        try:
+            await self.writer.wait_closed()
+        except ConnectionError:
+            pass
+
+
+class ScriptStream:
+    """Session I/O for --script: input comes from a transcript, output is captured per command"""
+
+    def __init__(self, lines):
+        self.lines = iter(lines)
+        self.line_number = 0
+        self.output = []
+
+    def write(self, data):
+        self.output.append(data)
+
+    async def drain(self):
+        pass
+
+    def flush_nowait(self):
+        pass
+
+    def wake(self):
+        pass
+
+    async def readline(self):
+        """Next transcript line, or an empty string at the end of the transcript"""
+        # The welcome text and prompts written before a command are not part of its result
+        self.output = []
+        line = next(self.lines, "")
+        if line:
+            self.line_number += 1
+        return line
+
+    def take_output(self):
+        """The output written since the last command was read, as text"""
+        output, self.output = self.output, []
+        return b"".join(output).decode(errors="replace")
+
+    async def close(self):
+        pass
+
+
+class SessionExpired(Exception):
+    """Raised by a stream when its session has been idle or open for too long"""
+
+
+class SessionManager:
+    """Admission control for --serve: a cap on concurrent sessions with a bounded
+    accept queue in front of it, and a cap on connections per client address.
+
+    Clients that cannot be admitted get a short "retry in N s" reply instead of
+    waiting behind an unbounded backlog."""
+
+    def __init__(self, max_sessions=None, queue_size=ACCEPT_QUEUE_SIZE, queue_timeout=ACCEPT_QUEUE_TIMEOUT,
+                 max_per_address=None, retry_after=RETRY_AFTER):
+        self.max_sessions = max_sessions
+        self.queue_size = queue_size
+        self.queue_timeout = queue_timeout
+        self.max_per_address = max_per_address
+        self.retry_after = retry_after
+        self.active = 0
+        # Futures of queued clients, first come first served; a released slot is handed
+        # straight to the oldest one
+        self.waiters = deque()
+        # Admitted and queued connections per client address
+        self.per_address = {}
+
+    async def admit(self, address, stream):
+        """Wait for a session slot; returns None once admitted, or the refusal message"""
+        count = self.per_address.get(address, 0)
+        if self.max_per_address is not None and count >= self.max_per_address:
+            return f"Too many connections from your address, retry in {self.retry_after} s."
+        if self.max_sessions is None or (self.active < self.max_sessions and not self.waiters):
+            self.active += 1
+        else:
+            if len(self.waiters) >= self.queue_size:
+                return f"Server busy, retry in {self.retry_after} s."
+            waiter = asyncio.get_running_loop().create_future()
+            self.waiters.append(waiter)
+            stream.write(f"Server busy: waiting for a free session ({len(self.waiters)} in line)...\n".encode())
+            stream.flush_nowait()
+            self.per_address[address] = count + 1
+            try:
+                await asyncio.wait_for(waiter, self.queue_timeout)
+            except asyncio.TimeoutError:
+                return f"Server busy, retry in {self.retry_after} s."
+            finally:
+                self.per_address[address] -= 1
+                if waiter in self.waiters:
+                    self.waiters.remove(waiter)
+        self.per_address[address] = self.per_address.get(address, 0) + 1
+        return None
+
+    def release(self, address):
+        """Free an admitted session's slot, handing it to the oldest queued client"""
+        self.per_address[address] -= 1
+        if not self.per_address[address]:
+            del self.per_address[address]
+        while self.waiters:
+            waiter = self.waiters.popleft()
+            if not waiter.done():
+                waiter.set_result(None)
+                return
+        self.active -= 1
+
+    @property
+    def queued(self):
+        return len(self.waiters)
+
+
+def session_budget(queue_size=ACCEPT_QUEUE_SIZE, with_listeners=False):
+    """Default (max_sessions, queue_size) for --serve that fit this process's open-file limit.
+
+    The accept queue gets at most a quarter of the descriptors; returns no session
+    cap when the limit is unbounded."""
+    limit, _ = resource.getrlimit(resource.RLIMIT_NOFILE)
+    if limit == resource.RLIM_INFINITY:
+        return None, queue_size
+    available = max(limit - RESERVED_DESCRIPTORS - REFUSAL_DESCRIPTORS, 0)
+    queue_size = min(queue_size, available // 4)
+    per_session = 1 + (OPEN_PORT_COUNT if with_listeners else 0)
+    return max((available - queue_size) // per_session, 1), queue_size
+
+async def handle_client(reader, writer, new_session, events=None, server_metrics=None,
+                        output_timeout=OUTPUT_TIMEOUT, write_high_water=WRITE_HIGH_WATER,
+                        port_allocator=None, listener_host="0.0.0.0", idle_timeout=IDLE_TIMEOUT,
+                        session_lifetime=SESSION_LIFETIME, session_manager=None):
+    """Run one challenge session against an accepted TCP connection.
+
+    new_session(stream, events, listeners) builds the game the connection plays."""
+    stream = SocketStream(reader, writer, output_timeout=output_timeout,
+                          high_water=write_high_water, low_water=write_high_water // 4,
+                          idle_timeout=idle_timeout, metrics=server_metrics)
+    address = stream.peer[0] if stream.peer else None
+    if session_manager is not None:
+        refusal = await session_manager.admit(address, stream)
+        if refusal is not None:
+            try:
+                stream.write(f"{refusal}\n".encode())
+                await stream.drain()
+            except ConnectionError:
+                pass
+            finally:
+                await stream.close()
+            return
+    if session_lifetime is not None:
+        stream.deadline = time.monotonic() + session_lifetime
+    session_listeners = None
+    if port_allocator is not None:
+        session_listeners = listeners.SessionListeners(port_allocator, host=listener_host, client_address=address)
+    game = new_session(stream, events, session_listeners)
+    active_streams.add(stream)
+    try:
+        await game.run()
+    except (ConnectionError, asyncio.IncompleteReadError):
+        # Peer reset the connection or stopped reading
+        pass
+    finally:
+        active_streams.discard(stream)
+        if session_manager is not None:
+            session_manager.release(address)
+        if session_listeners is not None:
+            session_listeners.close()
+        await stream.close()
+
+def report_output_queues(file=sys.stderr):
+    """Write the bytes queued for every active session (sent on SIGUSR1)"""
+    streams = sorted(active_streams, key=lambda stream: stream.bytes_queued, reverse=True)
+    print(f"{len(streams)} active sessions, {sum(stream.bytes_queued for stream in streams)} bytes queued",
+          file=file)
+    for stream in streams:
+        print(f"  {stream.peer}: {stream.bytes_queued} bytes queued", file=file)
+    file.flush()
+
+async def accept_clients(listener, max_connections=None, **session_options):
+    """Start a session task for every connection on listener, keeping at most
+    max_connections client sockets open; the rest wait in the kernel's backlog"""
+    loop = asyncio.get_running_loop()
+    slots = asyncio.Semaphore(max_connections) if max_connections else None
+    clients = set()
+
+    def finished(task):
+        clients.discard(task)
+        if slots is not None:
+            slots.release()
+
+    while True:
+        if slots is not None:
+            await slots.acquire()
+        try:
+            sock, _ = await loop.sock_accept(listener)
+        except OSError as error:
+            if slots is not None:
+                slots.release()
+            if error.errno in (errno.EMFILE, errno.ENFILE, errno.ENOBUFS, errno.ENOMEM):
+                print(f"accept() failed: {error}; nofile limit too low for the session limits?",
+                      file=sys.stderr)
+                await asyncio.sleep(ACCEPT_RETRY_DELAY)
+            continue
+        task = loop.create_task(serve_socket(sock, **session_options))
+        clients.add(task)
+        task.add_done_callback(finished)
+
+async def serve(port, host="0.0.0.0", metrics_port=None, metrics_file=None,
+                metrics_interval=metrics.SNAPSHOT_INTERVAL, max_connections=None, **session_options):
+    """Serve concurrent challenge sessions from a single process"""
+    server_metrics = session_options.get("server_metrics")
+    family = socket.AF_INET6 if ":" in host else socket.AF_INET
+    listener = socket.create_server((host, port), family=family, backlog=128)
+    listener.setblocking(False)
+    loop = asyncio.get_running_loop()
+    loop.add_signal_handler(signal.SIGUSR1, report_output_queues)
+    # Stop cleanly on SIGTERM so open sessions and the event log are flushed
+    loop.add_signal_handler(signal.SIGTERM, asyncio.current_task().cancel)
+    metrics_server = None
+    if metrics_port is not None:
+        metrics_server = await metrics.serve_metrics(server_metrics, metrics_port)
+    snapshots = None
+    if metrics_file is not None:
+        snapshots = asyncio.ensure_future(metrics.write_snapshots(server_metrics, metrics_file, metrics_interval))
+    try:
+        await accept_clients(listener, max_connections, **session_options)
+    except asyncio.CancelledError:
+        pass
+    finally:
+        listener.close()
+        if metrics_server is not None:
+            metrics_server.close()
+        if snapshots is not None:
+            snapshots.cancel()
+
+async def serve_socket(sock, **session_options):
+    """Run one challenge session against an already-accepted socket"""
+    reader, writer = await asyncio.open_connection(sock=sock)
+    await handle_client(reader, writer, **session_options)
+
+def open_event_log(event_log_options):
+    """Start an event log writer, or return None when event logging is off"""
+    if not event_log_options:
+        return None
+    return eventlog.EventLog(**event_log_options)
+
+def prefork(port, host="0.0.0.0", workers=8, event_log_options=None, sessions_per_worker=WORKER_SESSIONS,
+            **session_options):
+    """Zygote mode: keep a pool of warm pre-forked workers, one player at a time per worker process.
+
+    The caller loads everything sessions share (payload, port catalogs) before calling,
+    so each worker inherits that state and runs up to sessions_per_worker sessions one
+    after another, then exits and the parent forks a replacement. The pool size bounds
+    the number of processes, so keep it below the container's pid limit. Each worker
+    opens its own event log after forking, since the writer thread cannot survive a
+    fork; reusing workers keeps that to one log per worker rather than per session.
+    A worker that crashes prints its traceback; replacements for workers that fail to
+    start are delayed, and the pool gives up if that keeps happening."""
+    listener = socket.create_server((host, port), backlog=128)
+    children = set()
+    stop_signals = {signal.SIGTERM, signal.SIGINT}
+
+    def spawn():
+        # Hold off shutdown signals until the new pid is recorded, so no worker is orphaned
+        signal.pthread_sigmask(signal.SIG_BLOCK, stop_signals)
+        try:
+            pid = os.fork()
+            if pid == 0:
+                run_worker()
+            children.add(pid)
+        finally:
+            signal.pthread_sigmask(signal.SIG_UNBLOCK, stop_signals)
+
+    def run_worker():
+        status = 0
+        started = False
+        try:
+            # Exit through SystemExit so the session's event log is flushed
+            for signum in stop_signals:
+                signal.signal(signum, shutdown)
+            signal.pthread_sigmask(signal.SIG_UNBLOCK, stop_signals)
+            # Forked workers would otherwise all inherit the same shuffle sequence
+            random.seed()
+            events = open_event_log(event_log_options)
+            started = True
+            try:
+                for _ in range(sessions_per_worker):
+                    conn, _ = listener.accept()
+                    asyncio.run(serve_socket(conn, events=events, **session_options))
+            finally:
+                if events is not None:
+                    events.close()
+        except SystemExit:
+            pass
+        except BaseException:
+            traceback.print_exc()
+            status = 1 if started else WORKER_START_FAILED
+        finally:
+            sys.stderr.flush()
+            os._exit(status)
+
+    def shutdown(signum, frame):
+        raise SystemExit(0)
+
+    signal.signal(signal.SIGTERM, shutdown)
+    try:
+        for _ in range(workers):
+            spawn()
+        failed_starts = 0
+        while True:
+            pid, status = os.wait()
+            children.discard(pid)
+            if os.WIFEXITED(status) and os.WEXITSTATUS(status) == WORKER_START_FAILED:
+                failed_starts += 1
+                if failed_starts >= MAX_FAILED_STARTS:
+                    print(f"{failed_starts} workers in a row failed to start; stopping", file=sys.stderr)
+                    raise SystemExit(1)
+                time.sleep(min(RESPAWN_DELAY * 2 ** (failed_starts - 1), RESPAWN_DELAY_MAX))
+            else:
+                failed_starts = 0
+            spawn()
+    finally:
+        for pid in children:
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+        listener.close()
@@ -1,3 +1,9 @@
 #!/bin/bash
 set -e
-socat tcp-listen:5555,reuseaddr,fork EXEC:"python3 /app/main.py --treatment"
+# All players share one Python process; each TCP connection is its own session.
+# Concurrent sessions and the accept queue default to what the container's nofile
+# limit allows (see "Session limits" in the README); pass --max-sessions and
+# --accept-queue to size them explicitly.
+# The old fork-per-connection setup is still available with:
+#   socat tcp-listen:5555,reuseaddr,fork EXEC:"python3 /app/main.py --treatment"
+exec python3 /app/main.py --treatment --serve 5555
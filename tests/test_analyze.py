@@ -0,0 +1,121 @@
+"""analyze: loading logs into a session-sorted array and the per-condition aggregates"""
+import os
+
+import pytest
+
+np = pytest.importorskip("numpy")
+
+import analyze
+import eventlog
+from eventlog import CLOSED, COMPLETED, CONNECT, CONNECTED, DISCONNECTED, END, SCAN, START
+
+CONTROL, TREATMENT = 0, 1
+
+# (timestamp, session, event, condition, port, result, fragment), each session in time order.
+# Control: 556, 1812 and 389 are its default ports, 5000 and 2354 user-defined.
+COMPLETED_CONTROL = [
+    (0.0, 1, START, CONTROL, 0, 0, 0),
+    (10.0, 1, SCAN, CONTROL, 0, 0, 0),
+    (20.0, 1, CONNECT, CONTROL, 556, CONNECTED, 1),
+    (25.0, 1, CONNECT, CONTROL, 7, CLOSED, 0),
+    (40.0, 1, CONNECT, CONTROL, 5000, CONNECTED, 2),
+    (50.0, 1, CONNECT, CONTROL, 1812, CONNECTED, 3),
+    (70.0, 1, CONNECT, CONTROL, 2354, CONNECTED, 4),
+    (71.0, 1, END, CONTROL, 0, COMPLETED, 4),
+]
+ABANDONED_CONTROL = [
+    (100.0, 2, START, CONTROL, 0, 0, 0),
+    (105.0, 2, SCAN, CONTROL, 0, 0, 0),
+    (111.0, 2, CONNECT, CONTROL, 389, CONNECTED, 1),
+    (112.0, 2, END, CONTROL, 0, DISCONNECTED, 1),
+]
+# Treatment: every port chosen is a well-known default
+COMPLETED_TREATMENT = [
+    (0.0, 3, START, TREATMENT, 0, 0, 0),
+    (1.0, 3, CONNECT, TREATMENT, 1, CLOSED, 0),
+    (2.0, 3, CONNECT, TREATMENT, 80, CONNECTED, 1),
+    (4.0, 3, CONNECT, TREATMENT, 22, CONNECTED, 2),
+    (6.0, 3, CONNECT, TREATMENT, 53, CONNECTED, 3),
+    (8.0, 3, CONNECT, TREATMENT, 67, CONNECTED, 4),
+    (9.0, 3, END, TREATMENT, 0, COMPLETED, 4),
+]
+
+
+def events_array(records):
+    return np.array(records, dtype=analyze.EVENT_DTYPE)
+
+
+def write_binary(path, records, tail=b""):
+    with open(path, "wb") as f:
+        f.write(eventlog.MAGIC)
+        for record in records:
+            f.write(eventlog.RECORD.pack(*record))
+        f.write(tail)
+
+
+def write_jsonl(path, records):
+    with open(path, "wb") as f:
+        for record in records:
+            f.write(eventlog.encode_jsonl(record))
+
+
+def test_control_aggregates():
+    report = analyze.analyze(events_array(COMPLETED_CONTROL + ABANDONED_CONTROL + COMPLETED_TREATMENT))
+    control = report["control"]
+    assert control["sessions"] == 2
+    assert control["completion_rate"] == 0.5
+    assert control["connections"] == 5
+    assert control["default_choice_rate"] == pytest.approx(3 / 5)
+    assert control["user_defined_choice_rate"] == pytest.approx(2 / 5)
+    assert control["default_rate_by_choice_order"] == [1.0, 0.0, 1.0, 0.0]
+    assert control["mean_default_ports_per_session"] == 1.5
+    assert control["default_ports_per_session_histogram"] == [0, 1, 1, 0, 0]
+    assert control["closed_port_attempts"] == 1
+    assert control["sessions_with_closed_attempts"] == 0.5
+    # Delays between commands never span two sessions: 10, 5, 15, 10, 20 and 6 seconds
+    delays = control["time_between_commands"]
+    assert delays["count"] == 6
+    assert delays["mean_s"] == pytest.approx(11.0)
+    assert delays["p50_s"] == pytest.approx(10.0)
+    assert delays["p90_s"] == pytest.approx(17.5)
+
+
+def test_treatment_aggregates():
+    report = analyze.analyze(events_array(COMPLETED_CONTROL + ABANDONED_CONTROL + COMPLETED_TREATMENT))
+    treatment = report["treatment"]
+    assert treatment["sessions"] == 1
+    assert treatment["completion_rate"] == 1.0
+    assert treatment["connections"] == 4
+    assert treatment["default_choice_rate"] == 1.0
+    assert treatment["user_defined_choice_rate"] == 0.0
+    assert treatment["default_rate_by_choice_order"] == [1.0, 1.0, 1.0, 1.0]
+    assert treatment["default_ports_per_session_histogram"] == [0, 0, 0, 0, 1]
+    assert treatment["closed_port_attempts"] == 1
+    assert treatment["time_between_commands"]["count"] == 4
+    assert treatment["time_between_commands"]["mean_s"] == pytest.approx(1.75)
+
+
+def test_conditions_without_sessions_are_left_out():
+    assert list(analyze.analyze(events_array(COMPLETED_TREATMENT))) == ["treatment"]
+
+
+def test_load_events_sorts_sessions_across_files_and_formats(tmp_path):
+    directory = str(tmp_path)
+    # Session 1 rotates from the first file into the second; session 3 was logged as JSON lines
+    write_binary(os.path.join(directory, "events-a-1-x-0001.bin"),
+                 ABANDONED_CONTROL + COMPLETED_CONTROL[:3])
+    # A record cut short by a crash is ignored
+    write_binary(os.path.join(directory, "events-a-1-x-0002.bin"), COMPLETED_CONTROL[3:],
+                 tail=eventlog.RECORD.pack(*COMPLETED_TREATMENT[0])[:10])
+    write_jsonl(os.path.join(directory, "events-b-2-x-0001.jsonl"), COMPLETED_TREATMENT)
+    events = analyze.load_events([directory])
+    assert events.dtype == analyze.EVENT_DTYPE
+    expected = events_array(COMPLETED_CONTROL + ABANDONED_CONTROL + COMPLETED_TREATMENT)
+    assert events.tolist() == expected.tolist()
+    assert analyze.analyze(events) == analyze.analyze(expected)
+
+
+def test_load_events_with_no_records(tmp_path):
+    write_binary(os.path.join(str(tmp_path), "events-a-1-x-0001.bin"), [])
+    assert len(analyze.load_events([str(tmp_path)])) == 0
+    assert len(analyze.load_events([])) == 0
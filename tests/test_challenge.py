@@ -0,0 +1,147 @@
+"""PortScanningChallenge.run(): command results, completion and the --script output"""
+import asyncio
+import io
+import json
+import os
+import random
+
+import pytest
+
+import main
+import server
+from eventlog import (ALREADY_CONNECTED, CLOSED, COMPLETED, CONNECT, CONNECTED, END, INVALID, INVALID_PORT,
+                      NOT_SCANNED, SCAN)
+
+DATA = os.path.join(os.path.dirname(os.path.abspath(__file__)), "data")
+# Open ports of a control session after random.seed(SEED)
+SEED = 5
+OPEN_PORTS = (668, 389, 1812, 556, 6423, 6514, 2354, 5000)
+CLOSED_OR_NOT_SCANNED = "is closed or hasn't been scanned yet"
+
+
+class TranscriptStream(server.ScriptStream):
+    """A ScriptStream that also keeps everything written, as the terminal would show it"""
+
+    def __init__(self, lines):
+        super().__init__(lines)
+        self.transcript = []
+
+    def write(self, data):
+        super().write(data)
+        self.transcript.append(data)
+
+
+def play(*commands, treatment_mode=False):
+    """Run a seeded session; returns the game and (command, last_event, output) per command run"""
+    random.seed(SEED)
+    stream = server.ScriptStream([f"{command}\n" for command in commands])
+    game = main.PortScanningChallenge(treatment_mode=treatment_mode, stream=stream, clock=main.VirtualClock())
+    results = []
+
+    def report(line):
+        results.append((line.strip(), game.last_event, stream.take_output()))
+
+    asyncio.run(game.run(on_command=report))
+    return game, results
+
+
+def fragment(number):
+    return bytes(main.load_payload_parts()[number - 1]).decode()
+
+
+def test_seed_fixes_the_open_ports():
+    game, _ = play()
+    assert game.open_ports == OPEN_PORTS
+
+
+def test_scan_lists_every_open_port():
+    _, [(_, event, output)] = play("scan")
+    assert event == (SCAN, 0, 0, 0)
+    for port in OPEN_PORTS:
+        assert main.SCAN_LINE_FRAMES[port].decode() in output
+    assert "# 8 ports found open" in output
+
+
+def test_connect_to_a_scanned_port_reveals_the_next_fragment():
+    _, results = play("scan", "connect 668", "connect 389")
+    (_, first, first_output), (_, second, second_output) = results[1:]
+    assert first == (CONNECT, 668, CONNECTED, 1)
+    assert fragment(1) in first_output
+    assert second == (CONNECT, 389, CONNECTED, 2)
+    assert fragment(2) in second_output and fragment(1) not in second_output
+
+
+@pytest.mark.parametrize("commands, event, text", [
+    (("scan", "connect 668", "connect 668"), (CONNECT, 668, ALREADY_CONNECTED, 0),
+     "[!] Already connected to port 668."),
+    (("scan", "connect 22"), (CONNECT, 22, CLOSED, 0), f"Port 22 {CLOSED_OR_NOT_SCANNED}"),
+    (("connect 668",), (CONNECT, 668, NOT_SCANNED, 0), f"Port 668 {CLOSED_OR_NOT_SCANNED}"),
+    (("connect abc",), (CONNECT, 0, INVALID_PORT, 0), "Invalid port number."),
+    (("connect 99999",), (CONNECT, 0, INVALID_PORT, 0), "Valid ports range from 1-65535."),
+    (("bogus",), (INVALID, 0, 0, 0), "Invalid command."),
+    (("connect",), (INVALID, 0, 0, 0), "Invalid command."),
+    (("scan now",), (INVALID, 0, 0, 0), "Invalid command."),
+])
+def test_command_results(commands, event, text):
+    game, results = play(*commands)
+    _, last_event, output = results[-1]
+    assert last_event == event
+    assert text in output
+    assert "Encoded part" not in output
+    assert not game.game_completed
+
+
+def test_fourth_fragment_completes_the_session():
+    game, results = play("scan", "connect 668", "connect 389", "connect 1812", "connect 556", "status")
+    # The session ends on completion, so the trailing status never runs
+    assert [command for command, _, _ in results][-1] == "connect 556"
+    assert game.game_completed
+    assert game.last_event == (END, 0, COMPLETED, 4)
+    _, event, output = results[-1]
+    assert event == (CONNECT, 556, CONNECTED, 4)
+    assert fragment(4) in output
+    assert "Condition: 0\nPorts connected: 668, 389, 1812, 556\nTotal unique ports connected: 4\n" in output
+
+
+def test_treatment_opens_the_well_known_ports():
+    game, [(_, _, output)] = play("scan", treatment_mode=True)
+    assert set(main.DEFAULT_PORTS_POPULAR) <= set(game.open_ports)
+    assert main.SCAN_LINE_FRAMES[80].decode() in output
+
+
+def test_console_output_matches_the_recorded_session():
+    # Recorded from the original print()/input() version of the game
+    with open(os.path.join(DATA, "control_session.txt")) as f:
+        stream = TranscriptStream(f.readlines())
+    with open(os.path.join(DATA, "control_session.out"), "rb") as f:
+        expected = f.read()
+    random.seed(SEED)
+    game = main.PortScanningChallenge(stream=stream, clock=main.VirtualClock())
+    asyncio.run(game.run())
+    assert b"".join(stream.transcript) == expected
+
+
+def test_script_writes_a_json_line_per_command_and_a_summary(tmp_path):
+    path = str(tmp_path / "transcript.txt")
+    with open(path, "w") as f:
+        f.write("scan\nconnect 668\nconnect 1\nbogus\n")
+    out = io.StringIO()
+    asyncio.run(main.run_script([path], out=out, seed=SEED))
+    lines = [json.loads(line) for line in out.getvalue().splitlines()]
+    assert len(lines) == 5
+    commands = [{key: line[key] for key in ("line", "command", "event", "port", "result", "fragment")}
+                for line in lines[:4]]
+    assert commands == [
+        {"line": 1, "command": "scan", "event": "scan", "port": None, "result": None, "fragment": None},
+        {"line": 2, "command": "connect 668", "event": "connect", "port": 668, "result": "connected", "fragment": 1},
+        {"line": 3, "command": "connect 1", "event": "connect", "port": 1, "result": "closed", "fragment": None},
+        {"line": 4, "command": "bogus", "event": "invalid", "port": None, "result": None, "fragment": None},
+    ]
+    assert all(line["transcript"] == path for line in lines)
+    # Results are plain text: no prompt, no colour codes
+    assert fragment(1) in lines[1]["output"]
+    assert not any("\x1b" in line["output"] or "Enter command" in line["output"] for line in lines[:4])
+    summary = lines[4]
+    del summary["session"]
+    assert summary == {"transcript": path, "condition": 0, "end": "disconnected", "fragments": 1,
+                       "connected": [668], "commands": 4, "unprocessed": 0}
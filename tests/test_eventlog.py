@@ -0,0 +1,139 @@
+"""EventLog: record formats, rotation, retention and best-effort dropping"""
+import errno
+import os
+import threading
+
+import pytest
+
+import eventlog
+
+
+class SteppedLog(eventlog.EventLog):
+    """An EventLog that writes only when the test says so, one batch at a time"""
+
+    def __init__(self, directory, **options):
+        self.written = threading.Event()
+        super().__init__(directory, flush_interval=60, batch_size=1 << 20, **options)
+
+    def write_batch(self):
+        had_records = bool(self.queue)
+        super().write_batch()
+        if had_records:
+            self.written.set()
+
+    def write(self, *records):
+        """Write records as one batch and wait for it"""
+        self.written.clear()
+        for record in records:
+            self.emit(*record)
+        self.wakeup.set()
+        assert self.written.wait(5)
+
+
+def record(n):
+    """A distinct (session, event, condition, port, result, fragment, timestamp) tuple"""
+    return (n, eventlog.CONNECT, n % 2, 80, eventlog.CONNECTED, n % 4 + 1, 1000.0 + n)
+
+
+def stored(n):
+    session, event, condition, port, result, fragment, timestamp = record(n)
+    return (timestamp, session, event, condition, port, result, fragment)
+
+
+def log_files(directory):
+    return sorted(name for name in os.listdir(directory) if name.startswith("events-"))
+
+
+def read_all(directory):
+    return [entry for name in log_files(directory)
+            for entry in eventlog.read_events(os.path.join(directory, name))]
+
+
+@pytest.mark.parametrize("fmt", sorted(eventlog.FORMATS))
+def test_records_round_trip(tmp_path, fmt):
+    log = SteppedLog(str(tmp_path), fmt=fmt)
+    log.write(*(record(n) for n in range(10)))
+    log.close()
+    assert read_all(str(tmp_path)) == [stored(n) for n in range(10)]
+
+
+def test_binary_files_rotate_once_past_rotate_bytes(tmp_path):
+    log = SteppedLog(str(tmp_path), fmt="binary", rotate_bytes=len(eventlog.MAGIC) + 2 * eventlog.RECORD.size)
+    log.write(record(0))
+    log.write(record(1))
+    # The file has reached rotate_bytes, so the next batch starts a new one; a batch
+    # is never split, so it may pass rotate_bytes on its own
+    log.write(record(2), record(3), record(4))
+    log.write(record(5))
+    log.close()
+    names = log_files(str(tmp_path))
+    assert [name.rsplit("-", 1)[1] for name in names] == ["0001.bin", "0002.bin", "0003.bin"]
+    sizes = [os.path.getsize(os.path.join(str(tmp_path), name)) - len(eventlog.MAGIC) for name in names]
+    assert sizes == [2 * eventlog.RECORD.size, 3 * eventlog.RECORD.size, eventlog.RECORD.size]
+    assert read_all(str(tmp_path)) == [stored(n) for n in range(6)]
+
+
+def test_retention_deletes_only_this_logs_oldest_files(tmp_path):
+    directory = str(tmp_path)
+    # Another process's file, older and larger than anything this log writes
+    other = os.path.join(directory, "events-other-1-20200101T000000-0001.jsonl")
+    with open(other, "w") as f:
+        f.write("x" * 500 + "\n")
+    os.utime(other, (0, 0))
+    # One record per file, and room for four files
+    line = len(eventlog.encode_jsonl(stored(0)))
+    log = SteppedLog(directory, rotate_bytes=line, retain_bytes=4 * line)
+    for n in range(6):
+        log.write(record(n))
+    log.close()
+    assert os.path.exists(other)
+    os.remove(other)
+    names = log_files(directory)
+    assert all(name.startswith(log.prefix) for name in names)
+    assert sum(os.path.getsize(os.path.join(directory, name)) for name in names) <= 4 * line
+    # The newest records survive
+    assert read_all(directory) == [stored(n) for n in range(2, 6)]
+
+
+def test_retention_is_off_by_default(tmp_path):
+    log = SteppedLog(str(tmp_path), rotate_bytes=1)
+    for n in range(5):
+        log.write(record(n))
+    log.close()
+    assert len(log_files(str(tmp_path))) == 5
+
+
+def test_full_queue_drops_and_counts_records(tmp_path):
+    log = SteppedLog(str(tmp_path), max_queued=3)
+    for n in range(5):
+        log.emit(*record(n))
+    assert len(log.queue) == 3
+    assert log.dropped == 2
+    log.close()
+    assert read_all(str(tmp_path)) == [stored(n) for n in range(3)]
+
+
+def test_write_errors_are_counted_and_the_writer_keeps_going(tmp_path):
+    log = SteppedLog(str(tmp_path))
+
+    def disk_full():
+        raise OSError(errno.ENOSPC, "No space left on device")
+
+    log.open_next_file = disk_full
+    log.write(record(0), record(1))
+    assert (log.write_errors, log.dropped) == (1, 2)
+    assert log.thread.is_alive()
+    del log.open_next_file
+    log.write(record(2))
+    log.close()
+    assert read_all(str(tmp_path)) == [stored(2)]
+
+
+def test_readers_skip_records_cut_short(tmp_path):
+    log = SteppedLog(str(tmp_path), fmt="binary")
+    log.write(record(0), record(1))
+    log.close()
+    path = os.path.join(str(tmp_path), log_files(str(tmp_path))[0])
+    with open(path, "ab") as f:
+        f.write(eventlog.RECORD.pack(*stored(2))[:7])
+    assert list(eventlog.read_events(path)) == [stored(0), stored(1)]
@@ -0,0 +1,82 @@
+"""render_png: a valid 1-bit grayscale PNG whose pixels spell the text"""
+import base64
+import struct
+import zlib
+
+import pytest
+
+import flagimage
+from flagimage import FONT, GLYPH_HEIGHT, GLYPH_WIDTH
+
+
+def read_png(data):
+    """(width, height, rows of pixels with True for ink) from render_png output"""
+    assert data[:8] == b"\x89PNG\r\n\x1a\n"
+    chunks = []
+    position = 8
+    while position < len(data):
+        length, kind = struct.unpack(">I4s", data[position:position + 8])
+        body = data[position + 8:position + 8 + length]
+        crc, = struct.unpack(">I", data[position + 8 + length:position + 12 + length])
+        assert crc == zlib.crc32(kind + body)
+        chunks.append((kind, body))
+        position += 12 + length
+    assert [kind for kind, _ in chunks] == [b"IHDR", b"IDAT", b"IEND"]
+    width, height, depth, color, compression, filtering, interlace = struct.unpack(">IIBBBBB", chunks[0][1])
+    assert (depth, color, compression, filtering, interlace) == (1, 0, 0, 0, 0)
+    raw = zlib.decompress(chunks[1][1])
+    row_bytes = (width + 7) // 8
+    assert len(raw) == height * (row_bytes + 1)
+    rows = []
+    for y in range(height):
+        line = raw[y * (row_bytes + 1):(y + 1) * (row_bytes + 1)]
+        assert line[0] == 0
+        bits = int.from_bytes(line[1:], "big")
+        # 0 is black in 1-bit grayscale
+        rows.append([not bits >> (row_bytes * 8 - 1 - x) & 1 for x in range(width)])
+    return width, height, rows
+
+
+def glyph_pixels(rows, index, line=0, scale=4, margin=2):
+    """The ink of one glyph cell, sampled once per font unit"""
+    left = margin + index * (GLYPH_WIDTH + 1)
+    top = margin + line * (GLYPH_HEIGHT + 1)
+    return tuple(
+        sum(rows[(top + y) * scale][(left + x) * scale] << (GLYPH_WIDTH - 1 - x) for x in range(GLYPH_WIDTH))
+        for y in range(GLYPH_HEIGHT))
+
+
+def test_dimensions_follow_the_text_layout():
+    width, height, _ = read_png(flagimage.render_png("flag{x}", scale=3, margin=1))
+    assert width == (2 * 1 + 7 * (GLYPH_WIDTH + 1) - 1) * 3
+    assert height == (2 * 1 + GLYPH_HEIGHT) * 3
+
+
+@pytest.mark.parametrize("text", ["flag{Hi}", "0123456789", "A-Z_"])
+def test_pixels_spell_the_text(text):
+    _, _, rows = read_png(flagimage.render_png(text))
+    for index, char in enumerate(text):
+        assert glyph_pixels(rows, index) == FONT[char]
+
+
+def test_margins_and_gaps_are_blank():
+    scale, margin = 4, 2
+    width, height, rows = read_png(flagimage.render_png("##", scale=scale, margin=margin))
+    assert not any(rows[0]) and not any(rows[-1])
+    assert not any(row[0] for row in rows) and not any(row[-1] for row in rows)
+    # The column between the two glyphs
+    gap = (margin + GLYPH_WIDTH) * scale
+    assert not any(row[gap] for row in rows)
+
+
+def test_long_text_wraps_and_unknown_characters_render_as_question_marks():
+    text = "a" * 45 + "é"
+    width, height, rows = read_png(flagimage.render_png(text, line_length=40))
+    assert height == (2 * 2 + 2 * (GLYPH_HEIGHT + 1) - 1) * 4
+    assert width == (2 * 2 + 40 * (GLYPH_WIDTH + 1) - 1) * 4
+    assert glyph_pixels(rows, 5, line=1) == FONT["?"]
+    assert glyph_pixels(rows, 4, line=1) == FONT["a"]
+
+
+def test_encode_flag_is_the_base64_png():
+    assert base64.b64decode(flagimage.encode_flag("flag{x}")) == flagimage.render_png("flag{x}")
@@ -0,0 +1,23 @@
+"""SessionListeners: only the session's own player may use its services"""
+import listeners
+
+
+def session_listeners(client_address):
+    return listeners.SessionListeners(listeners.PortAllocator(40000, 40010), client_address=client_address)
+
+
+def test_only_the_players_address_is_allowed():
+    owned = session_listeners("192.0.2.7")
+    assert owned.allows(("192.0.2.7", 51000))
+    assert not owned.allows(("192.0.2.8", 51000))
+    assert not owned.allows(None)
+
+
+def test_ipv4_mapped_addresses_match_plain_ipv4():
+    assert session_listeners("::ffff:192.0.2.7").allows(("192.0.2.7", 51000))
+    assert session_listeners("192.0.2.7").allows(("::ffff:192.0.2.7", 51000, 0, 0))
+    assert not session_listeners("2001:db8::7").allows(("192.0.2.7", 51000))
+
+
+def test_without_a_client_address_anyone_is_allowed():
+    assert session_listeners(None).allows(("198.51.100.1", 51000))
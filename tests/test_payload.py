@@ -0,0 +1,61 @@
+"""PayloadCache: one render per flag, evicted least recently used by encoded size"""
+import base64
+
+import flagimage
+import main
+from main import PayloadCache
+
+
+def encoded_size(flag):
+    return len(flagimage.encode_flag(flag))
+
+
+def test_parts_join_to_the_encoded_flag_image():
+    parts = PayloadCache().get("flag{abc}")
+    assert len(parts) == main.PART_COUNT
+    encoded = b"".join(bytes(part) for part in parts)
+    assert encoded == flagimage.encode_flag("flag{abc}")
+    assert base64.b64decode(encoded).startswith(b"\x89PNG\r\n\x1a\n")
+
+
+def test_hit_returns_the_cached_parts(monkeypatch):
+    cache = PayloadCache()
+    first = cache.get("flag{abc}")
+    renders = []
+    monkeypatch.setattr(flagimage, "encode_flag", lambda flag: renders.append(flag))
+    assert cache.get("flag{abc}") is first
+    assert renders == []
+
+
+def test_evicts_the_least_recently_used_flag():
+    a, b, c = (encoded_size(flag) for flag in ("flag{a}", "flag{b}", "flag{c}"))
+    # Room for flag{a} with either of the others, but not all three
+    cache = PayloadCache(max_bytes=max(a + b, a + c))
+    cache.get("flag{a}")
+    cache.get("flag{b}")
+    cache.get("flag{a}")
+    cache.get("flag{c}")
+    assert list(cache.entries) == ["flag{a}", "flag{c}"]
+    assert cache.size == a + c
+
+
+def test_keeps_the_newest_entry_even_over_the_limit():
+    cache = PayloadCache(max_bytes=1)
+    cache.get("flag{a}")
+    parts = cache.get("flag{b}")
+    assert list(cache.entries) == ["flag{b}"]
+    assert cache.size == encoded_size("flag{b}")
+    # Evicted parts stay usable by the sessions holding them
+    assert b"".join(bytes(part) for part in parts) == flagimage.encode_flag("flag{b}")
+
+
+def test_per_session_flags_bypass_the_cache(monkeypatch):
+    monkeypatch.setattr(main, "payload_cache", PayloadCache())
+    game = main.PortScanningChallenge(flag="flag{abc}", per_session_flag=True, stream=object())
+    parts = game.generate_flag_parts()
+    assert b"".join(bytes(part) for part in parts) == flagimage.encode_flag(game.flag)
+    assert game.flag != "flag{abc}"
+    assert not main.payload_cache.entries
+    # A shared instance flag still goes through the cache
+    shared = main.PortScanningChallenge(flag="flag{abc}", stream=object())
+    assert shared.generate_flag_parts() is main.payload_cache.get("flag{abc}")
@@ -0,0 +1,132 @@
+"""SessionManager admission control: slots, the accept queue and per-address caps"""
+import asyncio
+import resource
+
+import server
+from server import SessionManager
+
+
+class FakeStream:
+    def __init__(self):
+        self.output = []
+
+    def write(self, data):
+        self.output.append(data)
+
+    def flush_nowait(self):
+        pass
+
+
+def run(coroutine):
+    return asyncio.run(coroutine)
+
+
+def test_admits_up_to_max_sessions_then_queues():
+    async def scenario():
+        manager = SessionManager(max_sessions=2, queue_size=4, queue_timeout=5)
+        assert await manager.admit("a", FakeStream()) is None
+        assert await manager.admit("b", FakeStream()) is None
+        stream = FakeStream()
+        waiting = asyncio.ensure_future(manager.admit("c", stream))
+        await asyncio.sleep(0)
+        assert not waiting.done()
+        assert manager.queued == 1
+        assert b"waiting for a free session (1 in line)" in b"".join(stream.output)
+        waiting.cancel()
+
+    run(scenario())
+
+
+def test_release_hands_the_slot_to_the_oldest_waiter():
+    async def scenario():
+        manager = SessionManager(max_sessions=1, queue_size=4, queue_timeout=5)
+        assert await manager.admit("a", FakeStream()) is None
+        first = asyncio.ensure_future(manager.admit("b", FakeStream()))
+        second = asyncio.ensure_future(manager.admit("c", FakeStream()))
+        await asyncio.sleep(0)
+        manager.release("a")
+        assert await first is None
+        assert not second.done()
+        # The slot moved to the waiter rather than being freed
+        assert manager.active == 1
+        manager.release("b")
+        assert await second is None
+        manager.release("c")
+        assert manager.active == 0
+        assert manager.per_address == {}
+
+    run(scenario())
+
+
+def test_full_queue_is_refused_immediately():
+    async def scenario():
+        manager = SessionManager(max_sessions=1, queue_size=1, queue_timeout=5, retry_after=7)
+        assert await manager.admit("a", FakeStream()) is None
+        waiting = asyncio.ensure_future(manager.admit("b", FakeStream()))
+        await asyncio.sleep(0)
+        assert await manager.admit("c", FakeStream()) == "Server busy, retry in 7 s."
+        waiting.cancel()
+
+    run(scenario())
+
+
+def test_queue_timeout_refuses_and_forgets_the_waiter():
+    async def scenario():
+        manager = SessionManager(max_sessions=1, queue_size=4, queue_timeout=0.05, retry_after=7)
+        assert await manager.admit("a", FakeStream()) is None
+        assert await manager.admit("b", FakeStream()) == "Server busy, retry in 7 s."
+        assert manager.queued == 0
+        assert manager.per_address.get("b", 0) == 0
+        # With nobody waiting, a release frees the slot
+        manager.release("a")
+        assert manager.active == 0
+        assert await manager.admit("b", FakeStream()) is None
+
+    run(scenario())
+
+
+def test_per_address_cap_counts_running_and_queued_connections():
+    async def scenario():
+        manager = SessionManager(max_sessions=1, queue_size=4, queue_timeout=5, max_per_address=2, retry_after=7)
+        assert await manager.admit("a", FakeStream()) is None
+        queued = asyncio.ensure_future(manager.admit("a", FakeStream()))
+        await asyncio.sleep(0)
+        refusal = await manager.admit("a", FakeStream())
+        assert refusal == "Too many connections from your address, retry in 7 s."
+        # Other addresses are unaffected
+        other = asyncio.ensure_future(manager.admit("b", FakeStream()))
+        await asyncio.sleep(0)
+        assert manager.queued == 2
+        manager.release("a")
+        assert await queued is None
+        assert manager.per_address == {"a": 1, "b": 1}
+        manager.release("a")
+        assert await other is None
+        assert manager.per_address == {"b": 1}
+
+    run(scenario())
+
+
+def test_unlimited_manager_only_enforces_the_address_cap():
+    async def scenario():
+        manager = SessionManager(max_sessions=None, max_per_address=1)
+        assert await manager.admit("a", FakeStream()) is None
+        assert await manager.admit("b", FakeStream()) is None
+        assert await manager.admit("a", FakeStream()) is not None
+
+    run(scenario())
+
+
+def test_session_budget_fits_the_open_file_limit(monkeypatch):
+    monkeypatch.setattr(resource, "getrlimit", lambda kind: (128, 4096))
+    max_sessions, queue_size = server.session_budget(64)
+    assert (max_sessions, queue_size) == (78, 26)
+    assert max_sessions + queue_size + server.RESERVED_DESCRIPTORS + server.REFUSAL_DESCRIPTORS <= 128
+    # Each session with live services also holds a listener per open port
+    max_sessions, queue_size = server.session_budget(64, with_listeners=True)
+    assert max_sessions * (1 + server.OPEN_PORT_COUNT) + queue_size <= 128 - server.RESERVED_DESCRIPTORS
+
+
+def test_session_budget_is_unlimited_without_a_limit(monkeypatch):
+    monkeypatch.setattr(resource, "getrlimit", lambda kind: (resource.RLIM_INFINITY, resource.RLIM_INFINITY))
+    assert server.session_budget(64) == (None, 64)